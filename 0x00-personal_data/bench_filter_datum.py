@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-field re.sub loop vs single-pass redaction
+"""
+import re
+import sys
+import time
+from typing import Callable, List
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+
+def legacy_filter_datum(fields: List[str], redaction: str, message: str,
+                        separator: str) -> str:
+    """ Original implementation: one re.sub per field """
+    for f in fields:
+        message = re.sub(rf"{f}=(.*?)\{separator}",
+                         f'{f}={redaction}{separator}', message)
+    return message
+
+
+def synthetic_lines(count: int) -> List[str]:
+    """ Build `count` log lines shaped like the users table export """
+    return ["name=user{0}; email=user{0}@example.com; phone=555-{0:07d}; "
+            "ssn=000-00-{0:04d}; password=hash{0};ip=10.0.0.{1}; "
+            "last_login=2019-11-14 06:14:24; user_agent=Mozilla/5.0;"
+            .format(i, i % 255) for i in range(count)]
+
+
+def run(label: str, redact: Callable[[str], str], lines: List[str]) -> float:
+    """ Redact every line and report lines/sec """
+    start = time.perf_counter()
+    for line in lines:
+        redact(line)
+    elapsed = time.perf_counter() - start
+    rate = len(lines) / elapsed
+    print("{:<12} {:>10.0f} lines/sec ({:.2f}s)".format(label, rate, elapsed))
+    return rate
+
+
+def main() -> None:
+    """ Benchmark entry point: optional argv[1] is the line count """
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lines = synthetic_lines(count)
+    sep = RedactingFormatter.SEPARATOR
+    red = RedactingFormatter.REDACTION
+
+    sample = lines[:1000]
+    for line in sample:
+        if legacy_filter_datum(PII_FIELDS, red, line, sep) != \
+                filter_datum(PII_FIELDS, red, line, sep):
+            raise SystemExit("output mismatch on: {}".format(line))
+
+    formatter = RedactingFormatter(fields=PII_FIELDS)
+    before = run("before", lambda m: legacy_filter_datum(
+        PII_FIELDS, red, m, sep), lines)
+    run("filter_datum", lambda m: filter_datum(PII_FIELDS, red, m, sep),
+        lines)
+    after = run("formatter", formatter.redact, lines)
+    print("speedup: {:.1f}x".format(after / before))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,78 @@
 #!/usr/bin/env python3
 """
 Encrypting passwords
+
+The bcrypt cost of new hashes comes from BCRYPT_COST, shared with the
+user authentication service, and defaults to bcrypt's own default (12).
+Calibrate it for a machine once with:
+
+    export BCRYPT_COST=$(./encrypt_password.py --calibrate [budget_ms])
 """
 
 
+import os
+import sys
+import time
+from functools import lru_cache
+from typing import Callable
+
 import bcrypt
 
+# bcrypt.gensalt() default: calibration may only raise the cost
+MIN_COST = 12
+MAX_COST = 16
+
+
+def calibrate_cost(budget_ms: float = 250, min_cost: int = MIN_COST,
+                   max_cost: int = MAX_COST) -> int:
+    """Highest bcrypt cost whose hash time on this machine stays under
+    `budget_ms`, never lower than `min_cost`"""
+    cost = min_cost
+    while cost < max_cost:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=cost + 1))
+        if (time.perf_counter() - start) * 1000 > budget_ms:
+            break
+        cost += 1
+    return cost
+
+
+@lru_cache(maxsize=None)
+def target_cost() -> int:
+    """Cost used for new hashes: BCRYPT_COST if set, otherwise MIN_COST"""
+    return int(os.getenv("BCRYPT_COST") or MIN_COST)
+
+
+def hash_cost(hashed_password: bytes) -> int:
+    """Cost factor stored in a `$2b$<cost>$...` hash"""
+    return int(hashed_password.split(b"$")[2])
+
+
+def needs_rehash(hashed_password: bytes) -> bool:
+    """Was the hash made with a cost below the current target?"""
+    return hash_cost(hashed_password) < target_cost()
+
 
 def hash_password(password: str) -> bytes:
     """Salted and hashed password generation"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    return bcrypt.hashpw(password.encode('utf-8'),
+                         bcrypt.gensalt(rounds=target_cost()))
+
+
+def is_valid(hashed_password: bytes, password: str,
+             rehash: Callable[[bytes], None] = None) -> bool:
+    """ is password valid?
+
+    On success, a hash below the target cost is recomputed and passed to
+    `rehash` so the caller can store it"""
+    valid = bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+    if valid and rehash is not None and needs_rehash(hashed_password):
+        rehash(hash_password(password))
+    return valid
 
 
-def is_valid(hashed_password: bytes, password: str) -> bool:
-    """ is password valid?"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed_password)
+if __name__ == "__main__":
+    if sys.argv[1:2] != ["--calibrate"]:
+        sys.exit("usage: {} --calibrate [budget_ms]".format(sys.argv[0]))
+    budget_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 250
+    print(calibrate_cost(budget_ms))
@@ -2,22 +2,61 @@
 """
 Filtered logger
 """
+import atexit
 import logging
 import os
+import queue
 import re
-from typing import List
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache, partial
+from logging.handlers import QueueHandler, QueueListener
+from typing import (Any, Callable, Dict, Iterator, List, Match, Pattern,
+                    TextIO, Tuple)
 import mysql.connector
 
 PII_FIELDS = ("name", "email", "phone", "ssn", "password")
+OVERFLOW_POLICIES = ("block", "drop_oldest", "count")
+
+
+@lru_cache(maxsize=128)
+def _redaction_pattern(fields: Tuple[str, ...],
+                       separator: str) -> Pattern[str]:
+    """ Compile every field into a single alternation, once per
+    (fields, separator) pair
+    """
+    names = "|".join(re.escape(f) for f in fields)
+    sep = re.escape(separator)
+    if len(separator) == 1:
+        # same as a lazy `.*?` up to the separator, without backtracking
+        value = "[^{}\\n]*".format(sep)
+    else:
+        value = ".*?"
+    return re.compile(rf"({names})={value}{sep}")
+
+
+@lru_cache(maxsize=128)
+def _redactor(fields: Tuple[str, ...], redaction: str,
+              separator: str) -> Callable[[str], str]:
+    """ Single-pass redaction function for (fields, redaction, separator)
+    """
+    pattern = _redaction_pattern(fields, separator)
+    replacements = {f: f"{f}={redaction}{separator}" for f in fields}
+
+    def replace(match: Match[str]) -> str:
+        return replacements[match.group(1)]
+
+    return partial(pattern.sub, replace)
 
 
 def filter_datum(fields: List[str], redaction: str, message: str,
                  separator: str) -> str:
     """ Filter and replace """
-    for f in fields:
-        message = re.sub(rf"{f}=(.*?)\{separator}",
-                         f'{f}={redaction}{separator}', message)
-    return message
+    if not fields:
+        return message
+    return _redactor(tuple(fields), redaction, separator)(message)
 
 
 class RedactingFormatter(logging.Formatter):
@@ -30,53 +69,347 @@ class RedactingFormatter(logging.Formatter):
     def __init__(self, fields: List[str]):
         """ Init """
         self.fields = fields
+        self._redact = _redactor(tuple(fields), self.REDACTION,
+                                 self.SEPARATOR)
         super(RedactingFormatter, self).__init__(self.FORMAT)
 
+    def redact(self, message: str) -> str:
+        """ Redact a message in a single pass """
+        if not self.fields:
+            return message
+        return self._redact(message)
+
     def format(self, record: logging.LogRecord) -> str:
         """ Format """
-        return filter_datum(self.fields, self.REDACTION,
-                            super().format(record), self.SEPARATOR)
+        return self.redact(super().format(record))
+
+
+class BoundedQueueHandler(QueueHandler):
+    """ Queue handler with a bounded queue and an overflow policy
+
+    - block: wait for room in the queue
+    - drop_oldest: discard the oldest queued record to make room
+    - count: discard the new record and count it in `dropped`
+    """
+
+    def __init__(self, maxsize: int = 10000, overflow: str = "block"):
+        """ Init """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow must be one of {}".format(
+                ", ".join(OVERFLOW_POLICIES)))
+        super(BoundedQueueHandler, self).__init__(queue.Queue(maxsize))
+        self.overflow = overflow
+        self.dropped = 0
 
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """ Enqueue a record according to the overflow policy """
+        if self.overflow == "block":
+            self.queue.put(record)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                if self.overflow == "count":
+                    self.dropped += 1
+                    return
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except queue.Empty:
+                pass
 
-def get_logger() -> logging.Logger:
-    """ logger """
+
+class BatchingQueueListener(QueueListener):
+    """ Queue listener formatting records on its own thread and writing
+    them to stream handlers in batches
+    """
+
+    def __init__(self, log_queue: queue.Queue, handler: logging.Handler,
+                 batch_size: int = 100):
+        """ Init """
+        super(BatchingQueueListener, self).__init__(
+            log_queue, handler, respect_handler_level=True)
+        self.batch_size = batch_size
+        self._batch = []
+
+    def handle(self, record: logging.LogRecord) -> None:
+        """ Buffer a record, writing the batch once it is full or the
+        queue has been drained
+        """
+        self._batch.append(self.prepare(record))
+        if len(self._batch) >= self.batch_size or self.queue.empty():
+            self.flush()
+
+    def flush(self) -> None:
+        """ Write all buffered records """
+        batch, self._batch = self._batch, []
+        for handler in self.handlers:
+            records = [r for r in batch if r.levelno >= handler.level]
+            if not isinstance(handler, logging.StreamHandler):
+                for record in records:
+                    handler.handle(record)
+                continue
+            lines = []
+            for record in records:
+                try:
+                    lines.append(handler.format(record) + handler.terminator)
+                except Exception:
+                    handler.handleError(record)
+            if not lines:
+                continue
+            handler.acquire()
+            try:
+                handler.stream.write("".join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(records[-1])
+            finally:
+                handler.release()
+
+    def enqueue_sentinel(self) -> None:
+        """ Wait for room in a full queue instead of raising """
+        self.queue.put(self._sentinel)
+
+    def stop(self) -> None:
+        """ Stop the thread and write whatever is still buffered """
+        if self._thread is not None:
+            super(BatchingQueueListener, self).stop()
+        self.flush()
+
+
+def get_logger(asynchronous: bool = False, queue_size: int = 10000,
+               overflow: str = "block",
+               batch_size: int = 100) -> logging.Logger:
+    """ logger
+
+    With `asynchronous`, records go through a bounded queue and are
+    redacted and written by a background listener thread; the
+    `BoundedQueueHandler` is reachable from `logger.handlers` and its
+    listener from `handler.listener`.
+    """
 
     logger = logging.getLogger("user_data")
     logger.setLevel(logging.INFO)
     logger.propagate = False
     handler = logging.StreamHandler()
     handler.setFormatter(RedactingFormatter(PII_FIELDS))
+    if asynchronous:
+        queue_handler = BoundedQueueHandler(queue_size, overflow)
+        listener = BatchingQueueListener(queue_handler.queue, handler,
+                                         batch_size)
+        queue_handler.listener = listener
+        listener.start()
+        atexit.register(listener.stop)
+        handler = queue_handler
     logger.addHandler(handler)
     return logger
 
 
+def _db_config() -> Dict[str, str]:
+    """ connection settings from the PERSONAL_DATA_DB_* variables """
+    return {
+        "host": os.environ.get('PERSONAL_DATA_DB_HOST', 'localhost'),
+        "database": os.environ.get('PERSONAL_DATA_DB_NAME'),
+        "user": os.environ.get('PERSONAL_DATA_DB_USERNAME', "root"),
+        "password": os.environ.get("PERSONAL_DATA_DB_PASSWORD", ""),
+    }
+
+
 def get_db() -> mysql.connector.connection.MySQLConnection:
     """ db conectivity """
-    psw = os.environ.get("PERSONAL_DATA_DB_PASSWORD", "")
-    username = os.environ.get('PERSONAL_DATA_DB_USERNAME', "root")
-    host = os.environ.get('PERSONAL_DATA_DB_HOST', 'localhost')
-    db_name = os.environ.get('PERSONAL_DATA_DB_NAME')
-    conn = mysql.connector.connect(
-        host=host,
-        database=db_name,
-        user=username,
-        password=psw)
-    return conn
-
-
-def main() -> None:
-    """Main function"""
+    return mysql.connector.connect(**_db_config())
+
+
+class ConnectionPool:
+    """ Pool of reusable database connections
+
+    Connections are health-checked on checkout and replaced once they
+    have been idle for longer than `max_idle` seconds. `connect` builds
+    a new connection and defaults to `get_db`.
+    """
+
+    def __init__(self, size: int = 5, max_idle: float = 300,
+                 connect: Callable[[], Any] = None):
+        """ Init """
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        self.size = size
+        self.max_idle = max_idle
+        self._connect = connect if connect is not None else get_db
+        self._idle = queue.LifoQueue(size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {"checkouts": 0, "waits": 0, "wait_time": 0.0,
+                       "timeouts": 0, "created": 0, "recycled": 0}
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """ Snapshot of checkouts, waits (timed out ones included),
+        total wait time (seconds), timeouts, connections created and
+        connections recycled
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    @staticmethod
+    def _healthy(conn: Any) -> bool:
+        """ Is the connection still usable? """
+        try:
+            if hasattr(conn, "is_connected"):
+                return bool(conn.is_connected())
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _discard(conn: Any) -> None:
+        """ Close a connection, ignoring errors """
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _new(self) -> Any:
+        """ Open a connection for a slot already reserved in `_created` """
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        with self._lock:
+            self._stats["created"] += 1
+        return conn
+
+    def acquire(self, timeout: float = None) -> Any:
+        """ Check a connection out, waiting up to `timeout` seconds when
+        all `size` connections are in use (raises queue.Empty)
+        """
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                conn, last_used = self._new(), None
+            else:
+                start = time.monotonic()
+                timed_out = True
+                try:
+                    conn, last_used = self._idle.get(timeout=timeout)
+                    timed_out = False
+                finally:
+                    # timed-out waits are the pool exhaustion to report
+                    with self._lock:
+                        self._stats["waits"] += 1
+                        self._stats["wait_time"] += time.monotonic() - start
+                        self._stats["timeouts"] += timed_out
+
+        if last_used is not None and (
+                time.monotonic() - last_used > self.max_idle or
+                not self._healthy(conn)):
+            self._discard(conn)
+            with self._lock:
+                self._stats["recycled"] += 1
+            conn = self._new()
+        with self._lock:
+            self._stats["checkouts"] += 1
+        return conn
+
+    def release(self, conn: Any) -> None:
+        """ Return a connection to the pool """
+        self._idle.put_nowait((conn, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout: float = None) -> Iterator[Any]:
+        """ Context manager checking a connection out and back in """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """ Close every idle connection """
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+            with self._lock:
+                self._created -= 1
+
+
+def get_db_pool(size: int = None, max_idle: float = 300) -> ConnectionPool:
+    """ pooled db conectivity, sized by PERSONAL_DATA_DB_POOL_SIZE
+    when `size` is not given
+    """
+    if size is None:
+        size = int(os.environ.get('PERSONAL_DATA_DB_POOL_SIZE', 5))
+    return ConnectionPool(size, max_idle)
+
+
+def _row_messages(cursor, batch_size: int) -> Iterator[str]:
+    """ Yield one `key=value; ` message per row, fetching `batch_size`
+    rows at a time
+    """
+    fields = cursor.column_names
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        for row in rows:
+            yield "; ".join("{}={}".format(k, v)
+                            for k, v in zip(fields, row)) + ";"
+
+
+def export_users(db: mysql.connector.connection.MySQLConnection,
+                 stream: TextIO, batch_size: int = 1000) -> int:
+    """ Stream the users table through RedactingFormatter into `stream`,
+    one write per batch. Returns the number of rows exported
+    """
+    formatter = RedactingFormatter(PII_FIELDS)
+    cursor = db.cursor(buffered=False)
+    count = 0
+    try:
+        cursor.execute("SELECT * FROM users;")
+        lines = []
+        for message in _row_messages(cursor, batch_size):
+            record = logging.LogRecord("user_data", logging.INFO, None,
+                                       None, message, None, None)
+            lines.append(formatter.format(record))
+            count += 1
+            if len(lines) >= batch_size:
+                stream.write("\n".join(lines) + "\n")
+                lines = []
+        if lines:
+            stream.write("\n".join(lines) + "\n")
+        stream.flush()
+    finally:
+        cursor.close()
+    return count
+
+
+def main(output: str = None, batch_size: int = 1000) -> None:
+    """Main function
+
+    Exports the redacted users table to `output` (stdout by default)
+    """
     db = get_db()
-    cursor = db.cursor()
-    cursor.execute("SELECT * FROM users;")
-    for row in cursor:
-        message = f"name={row[0]}; email={row[1]}; phone={row[2]}; " +\
-            f"ssn={row[3]}; password={row[4]};ip={row[5]}; " +\
-            f"last_login={row[6]}; user_agent={row[7]};"
-        print(message)
-    cursor.close()
-    db.close()
+    try:
+        if output is None:
+            export_users(db, sys.stdout, int(batch_size))
+        else:
+            with open(output, "w", buffering=1 << 16) as f:
+                export_users(db, f, int(batch_size))
+    finally:
+        db.close()
 
 
 if __name__ == '__main__':
-    main()
+    main(*sys.argv[1:3])
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Redact PII from an existing log file across several processes
+"""
+import argparse
+import mmap
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Tuple
+
+from filtered_logger import PII_FIELDS, RedactingFormatter, filter_datum
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def chunk_bounds(path: str, chunk_size: int = CHUNK_SIZE
+                 ) -> Iterator[Tuple[int, int]]:
+    """ Yield (start, end) byte offsets of roughly `chunk_size` bytes,
+    each ending on a line boundary
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            end = mm.find(b"\n", min(start + chunk_size, size) - 1)
+            end = size if end == -1 else end + 1
+            yield start, end
+            start = end
+
+
+def redact_chunk(path: str, start: int, end: int, fields: List[str],
+                 redaction: str, separator: str) -> bytes:
+    """ Redact bytes [start, end) of `path` """
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode("utf-8", "surrogateescape")
+    redacted = filter_datum(fields, redaction, text, separator)
+    return redacted.encode("utf-8", "surrogateescape")
+
+
+def redact_file(path: str, out: BinaryIO, fields: List[str] = PII_FIELDS,
+                redaction: str = RedactingFormatter.REDACTION,
+                separator: str = RedactingFormatter.SEPARATOR,
+                workers: int = None, chunk_size: int = CHUNK_SIZE) -> None:
+    """ Redact `path` chunk by chunk in a process pool, writing the
+    chunks to `out` in their original order
+    """
+    fields = list(fields)
+    workers = workers or os.cpu_count() or 1
+    pending = deque()
+    with ProcessPoolExecutor(workers) as executor:
+        for start, end in chunk_bounds(path, chunk_size):
+            pending.append(executor.submit(redact_chunk, path, start, end,
+                                           fields, redaction, separator))
+            # keep a bounded number of chunks in flight
+            if len(pending) >= 2 * workers:
+                out.write(pending.popleft().result())
+        while pending:
+            out.write(pending.popleft().result())
+    out.flush()
+
+
+def main() -> None:
+    """ CLI entry point """
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("input", help="log file to redact")
+    parser.add_argument("-o", "--output",
+                        help="output file (default: stdout)")
+    parser.add_argument("-f", "--fields", default=",".join(PII_FIELDS),
+                        help="comma-separated fields to redact")
+    parser.add_argument("-s", "--separator",
+                        default=RedactingFormatter.SEPARATOR)
+    parser.add_argument("-r", "--redaction",
+                        default=RedactingFormatter.REDACTION)
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="approximate chunk size in bytes")
+    args = parser.parse_args()
+
+    fields = [f for f in args.fields.split(",") if f]
+    options = dict(fields=fields, redaction=args.redaction,
+                   separator=args.separator, workers=args.workers,
+                   chunk_size=args.chunk_size)
+    if args.output is None:
+        redact_file(args.input, sys.stdout.buffer, **options)
+    else:
+        with open(args.output, "wb") as out:
+            redact_file(args.input, out, **options)
+
+
+if __name__ == '__main__':
+    main()
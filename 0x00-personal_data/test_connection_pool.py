@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests of ConnectionPool against a fake connector
+"""
+import queue
+import time
+import unittest
+
+from filtered_logger import ConnectionPool
+
+
+class FakeConnection:
+    """ Stand-in for a mysql.connector connection """
+
+    def __init__(self, number: int):
+        """ Init """
+        self.number = number
+        self.connected = True
+        self.closed = False
+
+    def is_connected(self) -> bool:
+        """ Health check used by the pool """
+        return self.connected
+
+    def close(self) -> None:
+        """ Close the connection """
+        self.closed = True
+        self.connected = False
+
+
+class FakeConnector:
+    """ connect= callable counting the connections it opens """
+
+    def __init__(self):
+        """ Init """
+        self.opened = []
+
+    def __call__(self) -> FakeConnection:
+        """ Open a new fake connection """
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+class TestConnectionPool(unittest.TestCase):
+    """ ConnectionPool checkout, recycling, timeout and stats """
+
+    def setUp(self):
+        """ A pool of two connections on a fake connector """
+        self.connector = FakeConnector()
+        self.pool = ConnectionPool(size=2, max_idle=300,
+                                   connect=self.connector)
+
+    def test_checkout_reuses_released_connection(self):
+        """ A released connection is handed out again """
+        with self.pool.connection() as conn:
+            pass
+        with self.pool.connection() as again:
+            self.assertIs(again, conn)
+        self.assertEqual(len(self.connector.opened), 1)
+        stats = self.pool.stats
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["waits"], 0)
+
+    def test_opens_up_to_size(self):
+        """ Concurrent checkouts open new connections up to size """
+        first = self.pool.acquire()
+        second = self.pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertEqual(self.pool.stats["created"], 2)
+
+    def test_recycles_unhealthy_connection(self):
+        """ A connection failing its health check is replaced """
+        with self.pool.connection() as conn:
+            conn.connected = False
+        with self.pool.connection() as fresh:
+            self.assertIsNot(fresh, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(self.pool.stats["recycled"], 1)
+
+    def test_recycles_idle_connection(self):
+        """ A connection idle for longer than max_idle is replaced """
+        pool = ConnectionPool(size=1, max_idle=0, connect=self.connector)
+        with pool.connection() as conn:
+            pass
+        time.sleep(0.01)
+        with pool.connection() as fresh:
+            self.assertIsNot(fresh, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats["recycled"], 1)
+
+    def test_timeout_is_counted_as_wait(self):
+        """ An exhausted pool times out and reports the wait """
+        self.pool.acquire()
+        self.pool.acquire()
+        with self.assertRaises(queue.Empty):
+            self.pool.acquire(timeout=0.05)
+        stats = self.pool.stats
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_time"], 0.04)
+
+    def test_waits_for_released_connection(self):
+        """ A waiting checkout gets the next released connection """
+        conn = self.pool.acquire()
+        self.pool.acquire()
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire(timeout=1), conn)
+
+    def test_close_discards_idle_connections(self):
+        """ close() closes the idle connections """
+        with self.pool.connection() as conn:
+            pass
+        self.pool.close()
+        self.assertTrue(conn.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
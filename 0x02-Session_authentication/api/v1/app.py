@@ -3,7 +3,7 @@
 Route module for the API
 """
 from os import getenv
-from api.v1.auth.auth import Auth
+from api.v1.auth.auth import Auth, ExclusionMatcher
 from api.v1.auth.basic_auth import BasicAuth
 from api.v1.views import app_views
 from flask import Flask, jsonify, abort, request
@@ -36,6 +36,12 @@ if auth_type == 'session_exp_auth':
 if auth_type == 'session_db_auth':
     auth = SessionDBAuth()
 
+# paths which dont require authentication, compiled once
+EXCLUDED_PATHS = ExclusionMatcher(['/api/v1/status/',
+                                   '/api/v1/unauthorized/',
+                                   '/api/v1/forbidden/',
+                                   '/api/v1/auth_session/login/'])
+
 
 @app.errorhandler(404)
 def not_found(error) -> str:
@@ -69,20 +75,16 @@ def before_request():
     if auth is None:
         return
 
-    # paths which dont require authentication
-    excluded_paths = ['/api/v1/status/',
-                      '/api/v1/unauthorized/',
-                      '/api/v1/forbidden/',
-                      '/api/v1/auth_session/login/']
-
     # Check if the request path is not in the excluded_paths list
-    if auth.require_auth(request.path, excluded_paths):
+    if auth.require_auth(request.path, EXCLUDED_PATHS):
         if auth.authorization_header(request) is None and \
                 auth.session_cookie(request) is None:
             abort(401)
-        if auth.current_user(request) is None:
+        # current_user is memoized on the request: resolved only once
+        user = auth.current_user(request)
+        if user is None:
             abort(403)
-        request.current_user = auth.current_user(request)
+        request.current_user = user
 
 
 if __name__ == "__main__":
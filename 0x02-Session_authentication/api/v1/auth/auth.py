@@ -6,36 +6,122 @@ Authentication handler
 
 import os
 import re
-from typing import List, TypeVar
+from functools import lru_cache, wraps
+from typing import Callable, List, Tuple, TypeVar
 from flask import request
 import fnmatch
 
 User = TypeVar('User')
+_UNRESOLVED = object()
+
+
+def memoize_per_request(current_user: Callable) -> Callable:
+    """Cache the result of current_user on the request object, so the
+    principal is resolved at most once per request.
+    """
+    @wraps(current_user)
+    def wrapper(self, request=None):
+        if request is None:
+            return current_user(self, request)
+        user = getattr(request, '_auth_current_user', _UNRESOLVED)
+        if user is _UNRESOLVED:
+            user = current_user(self, request)
+            try:
+                request._auth_current_user = user
+            except AttributeError:
+                pass
+        return user
+    return wrapper
+
+
+class ExclusionMatcher:
+    """Paths excluded from authentication, compiled once.
+
+    Each entry matches the paths starting with it, minus a trailing
+    '*' or '/' ('/api/v1/status/' matches '/api/v1/status' too, and
+    '/api/v1/stat*' matches '/api/v1/stats'):
+      - literal paths are first looked up in a set,
+      - all plain prefixes share a character trie,
+      - entries using other regex syntax fall back to one compiled
+        alternation, matched like before with re.match.
+    """
+
+    _END = ''
+    _REGEX_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+    def __init__(self, excluded_paths: List[str]):
+        """Build the set, trie and fallback regex of `excluded_paths`"""
+        self.exact = set()
+        self.trie = {}
+        patterns = []
+        for exclusion_path in map(lambda x: x.strip(), excluded_paths):
+            if not exclusion_path:
+                continue
+            if exclusion_path[-1] in '*/':
+                prefix = exclusion_path[0:-1]
+            else:
+                prefix = exclusion_path
+            wildcard = exclusion_path[-1] == '*'
+            if self._REGEX_CHARS.intersection(prefix):
+                patterns.append(prefix + ('.*' if wildcard else '/*'))
+                continue
+            if not wildcard:
+                self.exact.update((prefix, prefix + '/'))
+            node = self.trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[self._END] = True
+        self.regex = re.compile('|'.join(
+            '(?:{})'.format(p) for p in patterns)) if patterns else None
+
+    @classmethod
+    @lru_cache(maxsize=32)
+    def cached(cls, excluded_paths: Tuple[str, ...]) -> 'ExclusionMatcher':
+        """Matcher for a tuple of paths, built once per tuple"""
+        return cls(excluded_paths)
+
+    def match(self, path: str) -> bool:
+        """Is `path` excluded from authentication?"""
+        if path in self.exact:
+            return True
+        node = self.trie
+        if self._END in node:
+            return True
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if self._END in node:
+                return True
+        if self.regex is not None:
+            return self.regex.match(path) is not None
+        return False
 
 
 class Auth:
     '''Authentication handling'''
 
+    def __init_subclass__(cls, **kwargs):
+        """Every current_user override is memoized per request"""
+        super().__init_subclass__(**kwargs)
+        if 'current_user' in cls.__dict__:
+            cls.current_user = memoize_per_request(cls.current_user)
+
     def require_auth(self, path: str, excluded_paths: List[str]) -> bool:
         """
         Check if authentication is required for a given path.
 
         :param path: The path to check for authentication.
-        :param excluded_paths: List of paths that are excluded from
-          authentication checks.
+        :param excluded_paths: An ExclusionMatcher, or a list of paths
+          that are excluded from authentication checks.
         :return: True if authentication is required, False otherwise.
         """
         if path is not None and excluded_paths is not None:
-            for exclusion_path in map(lambda x: x.strip(), excluded_paths):
-                pattern = ''
-                if exclusion_path[-1] == '*':
-                    pattern = '{}.*'.format(exclusion_path[0:-1])
-                elif exclusion_path[-1] == '/':
-                    pattern = '{}/*'.format(exclusion_path[0:-1])
-                else:
-                    pattern = '{}/*'.format(exclusion_path)
-                if re.match(pattern, path):
-                    return False
+            if not isinstance(excluded_paths, ExclusionMatcher):
+                excluded_paths = ExclusionMatcher.cached(
+                    tuple(excluded_paths))
+            if excluded_paths.match(path):
+                return False
         return True
 
     def authorization_header(self, request=None) -> str:
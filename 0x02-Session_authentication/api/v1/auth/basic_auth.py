@@ -5,15 +5,88 @@ Basic Authentication handler
 
 
 import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
 from api.v1.auth.auth import Auth
 from typing import TypeVar
 from models.user import User
 
 
+class CredentialCache:
+    """Bounded LRU cache of verified Authorization headers
+
+    Entries are keyed by an HMAC of the raw header (with a per-process
+    key), so neither the header nor the password is kept in memory, and
+    expire after `ttl` seconds. An entry only counts while its user still
+    exists with the same email and password hash, so removing a user or
+    changing its email or password invalidates it.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        """Initialize an empty cache"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, authorization_header: str) -> bytes:
+        """Keyed digest of a header"""
+        return hmac.new(self._key, authorization_header.encode('utf-8'),
+                        hashlib.sha256).digest()
+
+    def get(self, authorization_header: str) -> TypeVar('User'):
+        """Return the user verified for this header, or None"""
+        if self.maxsize <= 0:
+            return None
+        digest = self._digest(authorization_header)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            user_id, email, password, expires = entry
+            if expires < time.monotonic():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+        user = User.get(user_id)
+        if user is None or user.email != email or \
+                user.password != password:
+            with self._lock:
+                self._entries.pop(digest, None)
+            return None
+        return user
+
+    def put(self, authorization_header: str, user: TypeVar('User')):
+        """Remember that this header authenticates `user`"""
+        if self.maxsize <= 0:
+            return
+        digest = self._digest(authorization_header)
+        with self._lock:
+            self._entries[digest] = (user.id, user.email, user.password,
+                                     time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
 class BasicAuth(Auth):
     """Basic Authentication handler - inherits from Auth
     """
 
+    def __init__(self) -> None:
+        """Initializes the verified-credential cache, sized by
+        BASIC_AUTH_CACHE_SIZE (0 disables it) and BASIC_AUTH_CACHE_TTL
+        """
+        super().__init__()
+        self.credential_cache = CredentialCache(
+            int(os.getenv('BASIC_AUTH_CACHE_SIZE', '1024')),
+            float(os.getenv('BASIC_AUTH_CACHE_TTL', '300')))
+
     def extract_base64_authorization_header(
             self, authorization_header: str) -> str:
         """returns the Base64 part of the Authorization header
@@ -94,10 +167,17 @@ class BasicAuth(Auth):
         overloads Auth and retrieves the User instance for a request
         """
         header = self.authorization_header(request)
+        if header is not None:
+            user = self.credential_cache.get(header)
+            if user is not None:
+                return user
         b64header = self.extract_base64_authorization_header(header)
         decoded = self.decode_base64_authorization_header(b64header)
         user_creds = self.extract_user_credentials(decoded)
-        return self.user_object_from_credentials(*user_creds)
+        user = self.user_object_from_credentials(*user_creds)
+        if user is not None:
+            self.credential_cache.put(header, user)
+        return user
 
     def extract_user_credentials(
             self, decoded_base64_authorization_header: str) -> (str, str):
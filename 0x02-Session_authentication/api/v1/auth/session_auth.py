@@ -5,6 +5,7 @@ Session authentication module for the API.
 
 
 from .auth import Auth
+from .session_store import MEMORY_STORE, SessionStore, get_session_store
 import uuid
 from models.user import User
 
@@ -13,7 +14,34 @@ class SessionAuth(Auth):
     """
     Session authentication class
     """
-    user_id_by_session_id = {}
+    # sessions of the default in-memory store (SESSION_STORE=memory);
+    # the file and Redis stores keep theirs outside this process
+    user_id_by_session_id = MEMORY_STORE.data
+
+    def __init__(self) -> None:
+        """
+        Initializes the session store selected by SESSION_STORE.
+        """
+        super().__init__()
+        self.store: SessionStore = self.new_store()
+
+    def new_store(self) -> SessionStore:
+        """
+        Session store of this instance, selected by SESSION_STORE.
+        """
+        return get_session_store()
+
+    def session_value(self, user_id: str):
+        """
+        Value stored for a new session of user_id.
+        """
+        return user_id
+
+    def session_ttl(self) -> int:
+        """
+        Lifetime of new sessions in seconds, None if they never expire.
+        """
+        return None
 
     def create_session(self, user_id: str = None) -> str:
         """
@@ -26,8 +54,9 @@ class SessionAuth(Auth):
             return None
         # Generate a Session ID using uuid4
         session_id = str(uuid.uuid4())
-        # Store the user_id in the user_id_by_session_id dictionary
-        self.user_id_by_session_id[session_id] = user_id
+        # Store the session in the session store
+        self.store.set(session_id, self.session_value(user_id),
+                       self.session_ttl())
 
         return session_id
 
@@ -42,8 +71,11 @@ class SessionAuth(Auth):
         if session_id is None or not isinstance(session_id, str):
             return None
 
-        # Use .get() to access the User ID based on the Session ID
-        return self.user_id_by_session_id.get(session_id)
+        # Expired sessions are never returned by the store
+        value = self.store.get(session_id)
+        if isinstance(value, dict):
+            return value.get('user_id')
+        return value
 
     def current_user(self, request=None):
         """
@@ -83,6 +115,5 @@ class SessionAuth(Auth):
         user_id = self.user_id_for_session_id(session_id)
         if (request is None or session_id is None) or user_id is None:
             return False
-        if session_id in self.user_id_by_session_id:
-            del self.user_id_by_session_id[session_id]
+        self.store.delete(session_id)
         return True
@@ -3,55 +3,31 @@
 and storage support module for the API.
 """
 from flask import request
-from datetime import datetime, timedelta
 
-from models.user_session import UserSession
+from .session_auth import SessionAuth
 from .session_exp_auth import SessionExpAuth
+from .session_store import UserSessionStore
 
 
 class SessionDBAuth(SessionExpAuth):
     """Session authentication class with expiration and storage support.
     """
 
-    def create_session(self, user_id=None) -> str:
-        """Creates and stores a session id for the user.
+    def new_store(self) -> UserSessionStore:
+        """Sessions are stored as UserSession objects.
         """
-        session_id = super().create_session(user_id)
-        if type(session_id) == str:
-            kwargs = {
-                'user_id': user_id,
-                'session_id': session_id,
-            }
-            user_session = UserSession(**kwargs)
-            user_session.save()
-            return session_id
+        return UserSessionStore(self.session_ttl())
 
-    def user_id_for_session_id(self, session_id=None):
-        """Retrieves the user id of the user associated with
-        a given session id.
+    def user_id_for_session_id(self, session_id=None) -> str:
+        """Retrieves the user id of a session id; the store checks
+        expiry against the (UTC) creation time of the UserSession.
         """
-        try:
-            sessions = UserSession.search({'session_id': session_id})
-        except Exception:
-            return None
-        if len(sessions) <= 0:
-            return None
-        cur_time = datetime.now()
-        time_span = timedelta(seconds=self.session_duration)
-        exp_time = sessions[0].created_at + time_span
-        if exp_time < cur_time:
-            return None
-        return sessions[0].user_id
+        return SessionAuth.user_id_for_session_id(self, session_id)
 
     def destroy_session(self, request=None) -> bool:
         """Destroys an authenticated session.
         """
         session_id = self.session_cookie(request)
-        try:
-            sessions = UserSession.search({'session_id': session_id})
-        except Exception:
+        if session_id is None:
             return False
-        if len(sessions) <= 0:
-            return False
-        sessions[0].remove()
-        return True
+        return self.store.delete(session_id)
@@ -6,6 +6,7 @@ from flask import request
 from datetime import datetime, timedelta
 
 from .session_auth import SessionAuth
+from .session_store import SweepingStore
 
 
 class SessionExpAuth(SessionAuth):
@@ -15,37 +16,54 @@ class SessionExpAuth(SessionAuth):
     def __init__(self) -> None:
         """Initializes a new SessionExpAuth instance.
         """
-        super().__init__()
         try:
             self.session_duration = int(os.getenv('SESSION_DURATION', '0'))
         except Exception:
             self.session_duration = 0
+        super().__init__()
+        # evict expired sessions in the background
+        if self.session_duration > 0 and \
+                isinstance(self.store, SweepingStore):
+            interval = float(os.getenv('SESSION_SWEEP_INTERVAL', '0') or 0)
+            self.store.start_sweeper(
+                interval or min(self.session_duration, 60))
 
-    def create_session(self, user_id=None):
-        """Creates a session id for the user.
+    def session_value(self, user_id: str) -> dict:
+        """Sessions record the user id and their creation time.
         """
-        session_id = super().create_session(user_id)
-        if not isinstance(session_id, str):
-            return None
-        self.user_id_by_session_id[session_id] = {
+        return {
             'user_id': user_id,
             'created_at': datetime.now(),
         }
-        return session_id
+
+    def session_ttl(self) -> int:
+        """Sessions expire after SESSION_DURATION seconds, if positive;
+        the store also drops them on its own.
+        """
+        if self.session_duration <= 0:
+            return None
+        return self.session_duration
 
     def user_id_for_session_id(self, session_id=None) -> str:
         """Retrieves the user id of the user associated with
         a given session id.
         """
-        if session_id in self.user_id_by_session_id:
-            session_dict = self.user_id_by_session_id[session_id]
-            if self.session_duration <= 0:
-                return session_dict['user_id']
-            if 'created_at' not in session_dict:
-                return None
-            cur_time = datetime.now()
-            time_span = timedelta(seconds=self.session_duration)
-            exp_time = session_dict['created_at'] + time_span
-            if exp_time < cur_time:
-                return None
-            return session_dict['user_id']
+        if session_id is None or not isinstance(session_id, str):
+            return None
+        session_dict = self.store.get(session_id)
+        if not isinstance(session_dict, dict):
+            return None
+        if self.session_duration <= 0:
+            return session_dict.get('user_id')
+        created_at = session_dict.get('created_at')
+        if created_at is None:
+            return None
+        if isinstance(created_at, str):
+            # read back from a JSON-backed store
+            created_at = datetime.fromisoformat(created_at)
+        cur_time = datetime.now()
+        time_span = timedelta(seconds=self.session_duration)
+        exp_time = created_at + time_span
+        if exp_time < cur_time:
+            return None
+        return session_dict.get('user_id')
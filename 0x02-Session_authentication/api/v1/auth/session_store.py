@@ -0,0 +1,445 @@
+#!/usr/bin/env python3
+"""
+Session stores: where session authentication keeps its sessions.
+"""
+
+
+import fcntl
+from abc import ABC, abstractmethod
+import heapq
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Tuple
+from urllib.parse import urlparse
+
+from models.user_session import UserSession
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value: Any) -> str:
+    """Encode the datetimes of session values (e.g. created_at) as ISO
+    strings in the JSON-backed stores."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class SessionStore(ABC):
+    """
+    Interface of a session store: session id -> JSON-serializable value,
+    with an optional time to live in seconds.
+    """
+
+    @abstractmethod
+    def set(self, session_id: str, value: Any, ttl: int = None) -> None:
+        """
+        Store a session.
+
+        :param session_id: The Session ID.
+        :param value: The value to keep for the session.
+        :param ttl: Seconds before the session expires, None for never.
+        """
+
+    @abstractmethod
+    def get(self, session_id: str) -> Any:
+        """
+        Get a live session.
+
+        :param session_id: The Session ID.
+        :return: The stored value, or None if missing or expired.
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        """
+        Delete a session.
+
+        :param session_id: The Session ID.
+        :return: True if a session was deleted.
+        """
+
+
+class SweepingStore(SessionStore):
+    """
+    Session store whose expired sessions are evicted by sweep().
+    """
+
+    _sweeper = None
+
+    @abstractmethod
+    def sweep(self) -> int:
+        """
+        Evict every expired session.
+
+        :return: The number of sessions evicted.
+        """
+
+    def start_sweeper(self, interval: float) -> None:
+        """
+        Run sweep() every interval seconds in a daemon thread (once per
+        store).
+        """
+        with self._lock:
+            if self._sweeper is not None:
+                return
+
+            def run():
+                while True:
+                    time.sleep(interval)
+                    # a failed sweep must not end the sweeper
+                    try:
+                        self.sweep()
+                    except Exception:
+                        logger.exception('session sweep failed')
+            self._sweeper = threading.Thread(target=run, daemon=True,
+                                             name='session-sweeper')
+            self._sweeper.start()
+
+
+class MemorySessionStore(SweepingStore):
+    """
+    Sessions in a dictionary of this process.
+
+    Sessions with a TTL are also pushed on a min-heap of deadlines, so
+    sweep() evicts expired sessions in O(expired * log n) without
+    scanning the live ones.
+    """
+
+    def __init__(self) -> None:
+        """Initializes an empty store."""
+        self.data = {}
+        self.expires = {}
+        self.evicted = 0
+        self._deadlines = []
+        self._lock = threading.Lock()
+
+    def set(self, session_id: str, value: Any, ttl: int = None) -> None:
+        """Store a session in memory."""
+        with self._lock:
+            self.data[session_id] = value
+            if ttl is None:
+                self.expires.pop(session_id, None)
+            else:
+                deadline = time.monotonic() + ttl
+                self.expires[session_id] = deadline
+                heapq.heappush(self._deadlines, (deadline, session_id))
+
+    def get(self, session_id: str) -> Any:
+        """Get a live session from memory."""
+        expires = self.expires.get(session_id)
+        if expires is not None and expires <= time.monotonic():
+            return None
+        return self.data.get(session_id)
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a session from memory."""
+        with self._lock:
+            self.expires.pop(session_id, None)
+            return self.data.pop(session_id, None) is not None
+
+    def sweep(self) -> int:
+        """
+        Evict every expired session.
+
+        :return: The number of sessions evicted.
+        """
+        now = time.monotonic()
+        count = 0
+        with self._lock:
+            deadlines = self._deadlines
+            while deadlines and deadlines[0][0] <= now:
+                deadline, session_id = heapq.heappop(deadlines)
+                # skip entries of sessions deleted or set again since
+                if self.expires.get(session_id) != deadline:
+                    continue
+                del self.expires[session_id]
+                self.data.pop(session_id, None)
+                count += 1
+            self.evicted += count
+        return count
+
+    @property
+    def metrics(self) -> Dict[str, int]:
+        """Live sessions (expired but unswept ones included), sessions
+        waiting in the expiry heap and sessions evicted so far."""
+        return {'live': len(self.data), 'scheduled': len(self._deadlines),
+                'evicted': self.evicted}
+
+
+class FileSessionStore(SessionStore):
+    """
+    Sessions in a JSON file shared by every process on the host.
+
+    The file is re-read only when its modification time changes, and
+    updates are made under an exclusive lock then written atomically.
+    """
+
+    def __init__(self, file_path: str) -> None:
+        """Initializes a store backed by file_path."""
+        self.file_path = file_path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._sessions = {}
+
+    def _load(self) -> Dict[str, Tuple[Any, float]]:
+        """Sessions of the file, re-read if it changed."""
+        try:
+            mtime = os.stat(self.file_path).st_mtime_ns
+        except FileNotFoundError:
+            self._mtime, self._sessions = None, {}
+            return self._sessions
+        if mtime != self._mtime:
+            with open(self.file_path, 'r') as f:
+                self._sessions = json.load(f)
+            self._mtime = mtime
+        return self._sessions
+
+    def _update(self, change) -> Any:
+        """Apply change(sessions) to the file under an exclusive lock."""
+        with self._lock, open(self.file_path + '.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            sessions = dict(self._load())
+            now = time.time()
+            for session_id, (_, expires) in list(sessions.items()):
+                if expires is not None and expires <= now:
+                    del sessions[session_id]
+            result = change(sessions)
+            tmp_path = self.file_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(sessions, f, default=_json_default)
+            os.replace(tmp_path, self.file_path)
+            self._sessions = sessions
+            self._mtime = os.stat(self.file_path).st_mtime_ns
+            return result
+
+    def set(self, session_id: str, value: Any, ttl: int = None) -> None:
+        """Store a session in the file."""
+        expires = None if ttl is None else time.time() + ttl
+
+        def change(sessions):
+            sessions[session_id] = [value, expires]
+        self._update(change)
+
+    def get(self, session_id: str) -> Any:
+        """Get a live session from the file."""
+        with self._lock:
+            entry = self._load().get(session_id)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.time():
+            return None
+        return value
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a session from the file."""
+        return self._update(
+            lambda sessions: sessions.pop(session_id, None) is not None)
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in a Redis (or Redis-protocol compatible) server, speaking
+    RESP over a plain socket. Expiry is left to the server (SET ... EX).
+    """
+
+    def __init__(self, url: str = 'redis://localhost:6379/0',
+                 prefix: str = 'session:', timeout: float = 5) -> None:
+        """Initializes a store for the server at url."""
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock = None
+        self._reader = None
+
+    def _connect(self) -> None:
+        """Open the connection, authenticate and select the database."""
+        self._sock = socket.create_connection((self.host, self.port),
+                                              self.timeout)
+        self._reader = self._sock.makefile('rb')
+        try:
+            if self.password:
+                self._call('AUTH', self.password)
+            if self.db:
+                self._call('SELECT', self.db)
+        except BaseException:
+            # never keep a connection that failed its handshake
+            self._sock.close()
+            self._sock = None
+            raise
+
+    def _call(self, *args) -> Any:
+        """Send one command and read its reply."""
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self) -> Any:
+        """Parse one RESP reply."""
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError('connection closed by server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RuntimeError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            return [self._read_reply() for _ in range(int(payload))]
+        raise RuntimeError('unexpected reply {!r}'.format(line))
+
+    def command(self, *args) -> Any:
+        """Run a command, reconnecting once if the connection dropped."""
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError):
+                    if self._sock is not None:
+                        self._sock.close()
+                    self._sock = None
+                    if attempt:
+                        raise
+
+    def set(self, session_id: str, value: Any, ttl: int = None) -> None:
+        """Store a session with SET, and EX when it expires."""
+        args = ['SET', self.prefix + session_id,
+                json.dumps(value, default=_json_default)]
+        if ttl is not None:
+            args += ['EX', max(int(ttl), 1)]
+        self.command(*args)
+
+    def get(self, session_id: str) -> Any:
+        """Get a live session with GET."""
+        data = self.command('GET', self.prefix + session_id)
+        return None if data is None else json.loads(data)
+
+    def delete(self, session_id: str) -> bool:
+        """Delete a session with DEL."""
+        return self.command('DEL', self.prefix + session_id) > 0
+
+
+class UserSessionStore(SweepingStore):
+    """
+    Sessions persisted as UserSession objects; a session expires ttl
+    seconds after its creation (never when ttl is None).
+
+    Lookups go through the session_id index of UserSession, writes are
+    batched (see UserSession.durability) and sweep() purges expired
+    rows using a min-heap of creation times.
+    """
+
+    def __init__(self, ttl: int = None) -> None:
+        """Initializes a store whose sessions live ttl seconds, loading
+        the sessions saved by previous runs."""
+        self.ttl = ttl
+        self.evicted = 0
+        self._deadlines = None
+        self._lock = threading.Lock()
+        UserSession.load_from_file()
+
+    def _find(self, session_id: str) -> UserSession:
+        """The UserSession of a session id, or None."""
+        if not isinstance(session_id, str):
+            return None
+        sessions = UserSession.search({'session_id': session_id})
+        return sessions[0] if sessions else None
+
+    def _expired(self, created_at: datetime) -> bool:
+        """Was a session created at created_at expired by now?"""
+        return self.ttl is not None and \
+            created_at + timedelta(seconds=self.ttl) < datetime.utcnow()
+
+    def set(self, session_id: str, value: Any, ttl: int = None) -> None:
+        """Save a UserSession for the session."""
+        user_session = UserSession(user_id=value['user_id'],
+                                   session_id=session_id)
+        user_session.save()
+        with self._lock:
+            if self._deadlines is not None:
+                heapq.heappush(self._deadlines,
+                               (user_session.created_at, session_id))
+
+    def get(self, session_id: str) -> Any:
+        """Get a live session from the UserSession objects."""
+        user_session = self._find(session_id)
+        if user_session is None or self._expired(user_session.created_at):
+            return None
+        return {'user_id': user_session.user_id,
+                'created_at': user_session.created_at}
+
+    def delete(self, session_id: str) -> bool:
+        """Remove the UserSession of the session."""
+        user_session = self._find(session_id)
+        if user_session is None:
+            return False
+        user_session.remove()
+        return True
+
+    def sweep(self) -> int:
+        """
+        Remove the UserSession objects past the session duration.
+
+        :return: The number of sessions removed.
+        """
+        if self.ttl is None:
+            return 0
+        count = 0
+        with self._lock:
+            if self._deadlines is None:
+                self._deadlines = [(s.created_at, s.session_id)
+                                   for s in UserSession.all()]
+                heapq.heapify(self._deadlines)
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            while self._deadlines and self._deadlines[0][0] < cutoff:
+                _, session_id = heapq.heappop(self._deadlines)
+                user_session = self._find(session_id)
+                if user_session is not None and \
+                        user_session.created_at < cutoff:
+                    user_session.remove()
+                    count += 1
+            self.evicted += count
+        return count
+
+
+MEMORY_STORE = MemorySessionStore()
+
+
+def get_session_store() -> SessionStore:
+    """
+    Session store selected by SESSION_STORE: memory (default, shared by
+    the whole process), file (SESSION_STORE_FILE) or redis
+    (SESSION_REDIS_URL).
+    """
+    kind = os.getenv('SESSION_STORE', 'memory')
+    if kind == 'file':
+        return FileSessionStore(
+            os.getenv('SESSION_STORE_FILE', '.db_sessions.json'))
+    if kind == 'redis':
+        return RedisSessionStore(
+            os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'))
+    return MEMORY_STORE
@@ -1,19 +1,65 @@
 #!/usr/bin/env python3
 """ Module of Users views
 """
+import json
 from api.v1.views import app_views
-from flask import abort, jsonify, request
+from flask import (abort, jsonify, request, Response, stream_with_context,
+                   url_for)
 from models.user import User
 
+STREAM_BATCH = 1000
+
+
+def stream_users(after: str = None):
+    """ Yield a JSON array of all users after `after`, one page at a time
+    """
+    yield '['
+    first = True
+    while True:
+        users = User.page(after, STREAM_BATCH)
+        for user in users:
+            yield ('' if first else ',') + json.dumps(user.to_json())
+            first = False
+        if len(users) < STREAM_BATCH:
+            break
+        after = users[-1].id
+    yield ']'
+
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def view_all_users() -> str:
     """ GET /api/v1/users
+    Query parameters (optional):
+      - limit: page size, users ordered by id
+      - after: id of the last user of the previous page
+      - stream: 1 to stream the whole list
     Return:
       - list of all User objects JSON represented
+      - a Link header to the next page when paginated
+      - 400 if limit isn't a positive integer
     """
-    all_users = [user.to_json() for user in User.all()]
-    return jsonify(all_users)
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    if request.args.get('stream') == '1':
+        return Response(stream_with_context(stream_users(after)),
+                        mimetype='application/json')
+    if limit is None and after is None:
+        all_users = [user.to_json() for user in User.all()]
+        return jsonify(all_users)
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit <= 0:
+            return jsonify({'error': "limit must be a positive integer"}), 400
+    users = User.page(after, limit)
+    res = jsonify([user.to_json() for user in users])
+    if limit is not None and len(users) == limit:
+        next_url = url_for('app_views.view_all_users', limit=limit,
+                           after=users[-1].id)
+        res.headers['Link'] = '<{}>; rel="next"'.format(next_url)
+    return res
 
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+""" Startup benchmark: User.load_from_file on 10k/100k/1M records
+
+Usage: ./bench_load_from_file.py [count ...]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+
+from models.base import DATA
+from models.user import User
+
+
+def legacy_load(cls):
+    """ Previous loader: json.load then cls(**obj_json) per object
+    """
+    s_class = cls.__name__
+    DATA[s_class] = {}
+    with open(".db_{}.json".format(s_class), 'r') as f:
+        for obj_id, obj_json in json.load(f).items():
+            DATA[s_class][obj_id] = cls(**obj_json)
+
+
+def write_store(count: int):
+    """ Write a .db_User.json with `count` users
+    """
+    objs = {}
+    for i in range(count):
+        obj_id = "00000000-0000-4000-8000-{:012d}".format(i)
+        objs[obj_id] = {
+            "id": obj_id,
+            "created_at": "2023-09-14T10:00:00",
+            "updated_at": "2023-09-14T10:00:00",
+            "email": "user{}@example.com".format(i),
+            "_password": "{:064x}".format(i),
+            "first_name": "First{}".format(i),
+            "last_name": None,
+        }
+    with open(".db_User.json", 'w') as f:
+        json.dump(objs, f)
+
+
+def timed(fn) -> float:
+    """ Seconds taken by fn()
+    """
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    """ Benchmark entry point
+    """
+    counts = [int(c) for c in sys.argv[1:]] or [10000, 100000, 1000000]
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        print("{:>9} {:>10} {:>10} {:>8}".format(
+            "records", "before (s)", "after (s)", "speedup"))
+        for count in counts:
+            write_store(count)
+            before = timed(lambda: legacy_load(User))
+            legacy = {k: v.to_json(True) for k, v in DATA["User"].items()}
+            after = timed(User.load_from_file)
+            fast = {k: v.to_json(True) for k, v in DATA["User"].items()}
+            if legacy != fast:
+                raise SystemExit("loaded objects differ")
+            print("{:>9} {:>10.2f} {:>10.2f} {:>7.1f}x".format(
+                count, before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
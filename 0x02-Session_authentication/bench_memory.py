@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+""" Memory benchmark: bytes per UserSession, default vs compact models
+
+Usage: ./bench_memory.py [count]
+"""
+import os
+import subprocess
+import sys
+import tracemalloc
+
+
+def measure(count: int) -> float:
+    """ Bytes allocated per UserSession kept in DATA
+    """
+    from models.base import DATA
+    from models.user_session import UserSession
+
+    user_ids = ["{:036d}".format(i) for i in range(1000)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    sessions = DATA.setdefault("UserSession", {})
+    for i in range(count):
+        obj = UserSession(user_id=user_ids[i % 1000],
+                          session_id="{:036d}".format(i))
+        sessions[obj.id] = obj
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / count
+
+
+def main():
+    """ Run each mode in its own interpreter, since the representation
+    is chosen at import time
+    """
+    if len(sys.argv) > 2 and sys.argv[1] == "--child":
+        print(measure(int(sys.argv[2])))
+        return
+    count = sys.argv[1] if len(sys.argv) > 1 else "1000000"
+    results = {}
+    for label, compact in (("default", "0"), ("compact", "1")):
+        env = dict(os.environ, MODELS_COMPACT=compact)
+        out = subprocess.run([sys.executable, __file__, "--child", count],
+                             env=env, check=True, capture_output=True,
+                             text=True, cwd=os.path.dirname(
+                                 os.path.abspath(__file__)))
+        results[label] = float(out.stdout)
+        print("{:<8} {:>8.0f} bytes/object".format(label, results[label]))
+    print("saved    {:>7.0f}%".format(
+        100 * (1 - results["compact"] / results["default"])))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,91 @@
 #!/usr/bin/env python3
 """ Base module
 """
-from datetime import datetime
-from typing import TypeVar, List, Iterable
-from os import path
+from datetime import datetime, timedelta
+from typing import TypeVar, List, Iterable, Callable
+from os import path, getenv, fsync
+from bisect import bisect_left, bisect_right
+import atexit
 import json
+import sys
+import threading
 import uuid
 
+from models.journal import Journal
+from models.snapshot import LazyObjects, Snapshot, write_snapshot
+
+try:
+    # optional, noticeably faster on large stores
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
+
 
 TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
 DATA = {}
+# "file" rewrites .db_<Class>.json on every write, "journal" appends to
+# .db_<Class>.journal and compacts it into the snapshot in the background,
+# "mmap" keeps a binary .db_<Class>.bin whose records load on first use
+# (rewritten whole on every change unless writes are batched)
+STORAGE = getenv("MODELS_STORAGE", "file")
+COMPACT_EVERY = int(getenv("MODELS_COMPACT_EVERY", "1000"))
+JOURNALS = {}
+# "write" writes the store on every change, "fsync" also forces it to
+# disk, "batched" coalesces the changes of COMMIT_WINDOW seconds (or
+# COMMIT_MAX changes) into one write
+DURABILITY = getenv("MODELS_DURABILITY", "write")
+COMMIT_WINDOW = float(getenv("MODELS_COMMIT_WINDOW", "0.05"))
+COMMIT_MAX = int(getenv("MODELS_COMMIT_MAX", "100"))
+COMMIT_LOCK = threading.RLock()
+DIRTY = {}
+TIMERS = {}
+# INDEX[class][attribute][value] holds the matching object ids (as dict
+# keys) and INDEXED[class][attribute][id] the value each id is filed under
+INDEX = {}
+INDEXED = {}
+# ORDER[class] is the sorted list of object ids, used for pagination
+ORDER = {}
+# compact mode: slotted instances with timestamps kept as epoch seconds
+COMPACT = getenv("MODELS_COMPACT", "0") == "1"
+EPOCH = datetime(1970, 1, 1)
+TIMESTAMP_SLOTS = {'_created_at': 'created_at', '_updated_at': 'updated_at'}
+
+
+def timestamp_property(slot: str) -> property:
+    """ datetime attribute stored as integer seconds since the epoch in
+    `slot`, materialized on access
+    """
+    def getter(self) -> datetime:
+        return EPOCH + timedelta(seconds=getattr(self, slot))
+
+    def setter(self, value: datetime):
+        setattr(self, slot, int((value - EPOCH).total_seconds()))
+
+    return property(getter, setter)
+
+
+@atexit.register
+def flush_all():
+    """ Write every pending batched change
+    """
+    for timer in list(TIMERS.values()):
+        timer.function()
 
 
 class Base():
     """ Base class
     """
 
+    # attributes kept in a hash index for search(), e.g. ('email',)
+    indexed_attributes = ()
+    # per-class override of DURABILITY
+    durability = None
+
+    if COMPACT:
+        __slots__ = ('id', '_created_at', '_updated_at')
+        created_at = timestamp_property('_created_at')
+        updated_at = timestamp_property('_updated_at')
+
     def __init__(self, *args: list, **kwargs: dict):
         """ Initialize a Base instance
         """
@@ -48,7 +118,11 @@ class Base():
         """ Convert the object a JSON dictionary
         """
         result = {}
-        for key, value in self.__dict__.items():
+        if COMPACT:
+            items = ((k, getattr(self, k)) for k in self.attribute_names())
+        else:
+            items = self.__dict__.items()
+        for key, value in items:
             if not for_serialization and key[0] == '_':
                 continue
             if type(value) is datetime:
@@ -57,33 +131,294 @@ class Base():
                 result[key] = value
         return result
 
+    @classmethod
+    def attribute_names(cls) -> tuple:
+        """ Interned names of the instance attributes, in the order
+        __init__ sets them
+        """
+        names = cls.__dict__.get('_attribute_names')
+        if names is None:
+            if COMPACT:
+                names = []
+                for klass in reversed(cls.__mro__):
+                    for slot in klass.__dict__.get('__slots__', ()):
+                        names.append(TIMESTAMP_SLOTS.get(slot, slot))
+            else:
+                names = cls(id=None).__dict__
+            names = tuple(sys.intern(name) for name in names)
+            setattr(cls, '_attribute_names', names)
+        return names
+
     @classmethod
     def load_from_file(cls):
         """ Load all objects from file
         """
+        # write pending batched changes first so they are not lost
+        cls.flush()
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
         DATA[s_class] = {}
+        from_json = cls._loader()
+        if STORAGE == "mmap":
+            cls._load_snapshot(from_json)
+            return
+        if path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                objs_json = json_loads(f.read())
+                for obj_id, obj_json in objs_json.items():
+                    DATA[s_class][obj_id] = from_json(obj_json)
+
+        if STORAGE == "journal":
+            for record in cls._journal().replay():
+                if record["op"] == "put":
+                    DATA[s_class][record["id"]] = from_json(record["obj"])
+                else:
+                    DATA[s_class].pop(record["id"], None)
+
+        INDEX[s_class] = {}
+        INDEXED[s_class] = {}
+        for obj in DATA[s_class].values():
+            cls._index(obj)
+        ORDER[s_class] = sorted(DATA[s_class])
+
+    @classmethod
+    def _load_snapshot(cls, from_json: Callable[[dict], TypeVar('Base')]):
+        """ Map .db_<Class>.bin without decoding its records; indexes
+        are rebuilt from the values stored in the snapshot index
+
+        Without a .bin file, a .db_<Class>.json left by the "file"
+        storage is loaded and written as the first snapshot
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.bin".format(s_class)
+        INDEX[s_class] = {}
+        INDEXED[s_class] = {}
         if not path.exists(file_path):
+            json_path = ".db_{}.json".format(s_class)
+            if path.exists(json_path):
+                with open(json_path, 'rb') as f:
+                    for obj_id, obj_json in json_loads(f.read()).items():
+                        DATA[s_class][obj_id] = from_json(obj_json)
+                for obj in DATA[s_class].values():
+                    cls._index(obj)
+                with COMMIT_LOCK:
+                    cls._write_snapshot()
+            ORDER[s_class] = sorted(DATA[s_class])
             return
+        snapshot = Snapshot(file_path)
+        objs = LazyObjects(snapshot,
+                           lambda payload: from_json(json_loads(payload)))
+        DATA[s_class] = objs
+        stored = snapshot.attributes
+        for attr in cls.indexed_attributes:
+            if attr in stored:
+                pos = stored.index(attr)
+                for obj_id, entry in snapshot.entries.items():
+                    cls._index_value(obj_id, attr, entry[2][pos])
+            else:
+                for obj_id in snapshot.entries:
+                    cls._index_value(obj_id, attr,
+                                     getattr(objs[obj_id], attr, None))
+        ORDER[s_class] = sorted(snapshot.entries)
+
+    @classmethod
+    def _write_snapshot(cls):
+        """ Rewrite the whole .db_<Class>.bin, copying records never
+        decoded byte for byte, and fsync it in "fsync" durability
+        """
+        s_class = cls.__name__
+        file_path = ".db_{}.bin".format(s_class)
+        objs = DATA[s_class]
+        attributes = list(cls.indexed_attributes)
+        lazy = isinstance(objs, LazyObjects) and \
+            objs.snapshot.attributes == attributes
+
+        def records():
+            for obj_id in list(objs):
+                raw = objs.raw(obj_id) if lazy else None
+                if raw is not None:
+                    yield obj_id, raw[0], raw[1]
+                    continue
+                try:
+                    obj = objs[obj_id]
+                except KeyError:
+                    # removed since the ids were listed
+                    continue
+                payload = json.dumps(obj.to_json(True)).encode()
+                yield obj_id, payload, [getattr(obj, attr, None)
+                                        for attr in attributes]
+
+        write_snapshot(file_path, attributes, records(),
+                       cls._durability() == "fsync")
+        if isinstance(objs, LazyObjects):
+            objs.rebase(Snapshot(file_path))
+
+    @classmethod
+    def _loader(cls) -> Callable[[dict], TypeVar('Base')]:
+        """ Function building objects from their JSON dictionaries
 
-        with open(file_path, 'r') as f:
-            objs_json = json.load(f)
-            for obj_id, obj_json in objs_json.items():
-                DATA[s_class][obj_id] = cls(**obj_json)
+        Equivalent to `cls(**obj_json)` for classes whose __init__ reads
+        each attribute with kwargs.get(), but __init__ runs only once (to
+        learn the attribute names) and timestamps use fromisoformat
+        """
+        keys = cls.attribute_names()
+        parse = datetime.fromisoformat
+
+        def from_json(obj_json: dict) -> TypeVar('Base'):
+            get = obj_json.get
+            attrs = {k: get(k) for k in keys}
+            if 'id' not in obj_json:
+                attrs['id'] = str(uuid.uuid4())
+            for k in ('created_at', 'updated_at'):
+                value = attrs[k]
+                attrs[k] = parse(value) if value is not None \
+                    else datetime.utcnow()
+            obj = cls.__new__(cls)
+            if COMPACT:
+                for k, value in attrs.items():
+                    setattr(obj, k, value)
+            else:
+                obj.__dict__ = attrs
+            return obj
+
+        return from_json
+
+    @classmethod
+    def _index(cls, obj: TypeVar('Base')):
+        """ File an object under the current value of each indexed
+        attribute
+        """
+        for attr in cls.indexed_attributes:
+            cls._index_value(obj.id, attr, getattr(obj, attr, None))
+
+    @classmethod
+    def _index_value(cls, obj_id: str, attr: str, value):
+        """ File an id under `value` in the index of `attr`
+        """
+        s_class = cls.__name__
+        index = INDEX.setdefault(s_class, {}).setdefault(attr, {})
+        indexed = INDEXED.setdefault(s_class, {}).setdefault(attr, {})
+        if obj_id in indexed:
+            if indexed[obj_id] == value:
+                return
+            cls._unindex_value(index, indexed.pop(obj_id), obj_id)
+        try:
+            index.setdefault(value, {})[obj_id] = None
+        except TypeError:
+            # unhashable value: only reachable by a full scan
+            return
+        indexed[obj_id] = value
+
+    @classmethod
+    def _unindex(cls, obj: TypeVar('Base')):
+        """ Drop an object from every index
+        """
+        s_class = cls.__name__
+        for attr in cls.indexed_attributes:
+            indexed = INDEXED.get(s_class, {}).get(attr, {})
+            if obj.id in indexed:
+                cls._unindex_value(INDEX[s_class][attr],
+                                   indexed.pop(obj.id), obj.id)
+
+    @staticmethod
+    def _unindex_value(index: dict, value, obj_id: str):
+        """ Remove one id from the bucket of a value
+        """
+        bucket = index.get(value)
+        if bucket is not None:
+            bucket.pop(obj_id, None)
+            if len(bucket) == 0:
+                del index[value]
+
+    @classmethod
+    def _snapshot(cls) -> dict:
+        """ JSON dictionary of all objects of the class
+        """
+        s_class = cls.__name__
+        objs_json = {}
+        for obj_id, obj in list(DATA[s_class].items()):
+            objs_json[obj_id] = obj.to_json(True)
+        return objs_json
 
     @classmethod
     def save_to_file(cls):
         """ Save all objects to file
         """
+        if STORAGE == "journal":
+            cls._journal().compact(cls._snapshot)
+            return
+        if STORAGE == "mmap":
+            with COMMIT_LOCK:
+                cls._write_snapshot()
+            return
         s_class = cls.__name__
         file_path = ".db_{}.json".format(s_class)
-        objs_json = {}
-        for obj_id, obj in DATA[s_class].items():
-            objs_json[obj_id] = obj.to_json(True)
+        with COMMIT_LOCK:
+            objs_json = cls._snapshot()
+            with open(file_path, 'w') as f:
+                json.dump(objs_json, f)
+                if cls._durability() == "fsync":
+                    f.flush()
+                    fsync(f.fileno())
+
+    @classmethod
+    def _durability(cls) -> str:
+        """ Durability mode of the class
+        """
+        return cls.durability or DURABILITY
+
+    @classmethod
+    def _commit(cls):
+        """ Persist a change now, or mark the class dirty when writes
+        are batched
+        """
+        if cls._durability() != "batched":
+            cls.save_to_file()
+            return
+        s_class = cls.__name__
+        with COMMIT_LOCK:
+            DIRTY[s_class] = DIRTY.get(s_class, 0) + 1
+            if DIRTY[s_class] < COMMIT_MAX:
+                if TIMERS.get(s_class) is None:
+                    timer = threading.Timer(COMMIT_WINDOW, cls.flush)
+                    timer.daemon = True
+                    TIMERS[s_class] = timer
+                    timer.start()
+                return
+        cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """ Write pending batched changes of the class right away
+        """
+        s_class = cls.__name__
+        with COMMIT_LOCK:
+            timer = TIMERS.pop(s_class, None)
+            if timer is not None:
+                timer.cancel()
+            if DIRTY.pop(s_class, 0) > 0:
+                cls.save_to_file()
+
+    @classmethod
+    def _journal(cls) -> Journal:
+        """ Journal of the class, created on first use
+        """
+        s_class = cls.__name__
+        if JOURNALS.get(s_class) is None:
+            JOURNALS[s_class] = Journal(".db_{}.journal".format(s_class),
+                                        ".db_{}.json".format(s_class))
+        return JOURNALS[s_class]
 
-        with open(file_path, 'w') as f:
-            json.dump(objs_json, f)
+    @classmethod
+    def _log_change(cls, op: str, obj: TypeVar('Base')):
+        """ Append a change to the journal, compacting when it grows
+        past COMPACT_EVERY records
+        """
+        journal = cls._journal()
+        obj_json = obj.to_json(True) if op == "put" else None
+        journal.append(op, obj.id, obj_json, cls._durability() == "fsync")
+        if journal.records >= COMPACT_EVERY:
+            journal.compact_in_background(cls._snapshot)
 
     def save(self):
         """ Save current object
@@ -91,15 +426,32 @@ class Base():
         s_class = self.__class__.__name__
         self.updated_at = datetime.utcnow()
         DATA[s_class][self.id] = self
-        self.__class__.save_to_file()
+        self.__class__._index(self)
+        order = ORDER.setdefault(s_class, [])
+        pos = bisect_left(order, self.id)
+        if pos == len(order) or order[pos] != self.id:
+            order.insert(pos, self.id)
+        if STORAGE == "journal":
+            self.__class__._log_change("put", self)
+        else:
+            self.__class__._commit()
 
     def remove(self):
         """ Remove object
         """
         s_class = self.__class__.__name__
-        if DATA[s_class].get(self.id) is not None:
-            del DATA[s_class][self.id]
-            self.__class__.save_to_file()
+        # a single pop, so concurrent removes (request threads and the
+        # session sweeper) cannot both pass a check and fail on del
+        if DATA[s_class].pop(self.id, None) is not None:
+            self.__class__._unindex(self)
+            order = ORDER.get(s_class, [])
+            pos = bisect_left(order, self.id)
+            if pos < len(order) and order[pos] == self.id:
+                del order[pos]
+            if STORAGE == "journal":
+                self.__class__._log_change("del", self)
+            else:
+                self.__class__._commit()
 
     @classmethod
     def count(cls) -> int:
@@ -114,6 +466,24 @@ class Base():
         """
         return cls.search()
 
+    @classmethod
+    def page(cls, after: str = None,
+             limit: int = None) -> List[TypeVar('Base')]:
+        """ Return up to `limit` objects ordered by id, starting after
+        the id `after`
+        """
+        s_class = cls.__name__
+        order = ORDER.get(s_class, [])
+        start = 0 if after is None else bisect_right(order, after)
+        end = len(order) if limit is None else start + limit
+        objs = DATA.get(s_class, {})
+        result = []
+        for obj_id in order[start:end]:
+            obj = objs.get(obj_id)
+            if obj is not None:
+                result.append(obj)
+        return result
+
     @classmethod
     def get(cls, id: str) -> TypeVar('Base'):
         """ Return one object by ID
@@ -124,6 +494,9 @@ class Base():
     @classmethod
     def search(cls, attributes: dict = {}) -> List[TypeVar('Base')]:
         """ Search all objects with matching attributes
+
+        When one of the attributes is indexed, only the objects saved
+        with that value are scanned
         """
         s_class = cls.__name__
         def _search(obj):
@@ -133,5 +506,16 @@ class Base():
                 if (getattr(obj, k) != v):
                     return False
             return True
-        
-        return list(filter(_search, DATA[s_class].values()))
+
+        candidates = DATA[s_class].values()
+        for k in cls.indexed_attributes:
+            if k in attributes and k in INDEX.get(s_class, {}):
+                try:
+                    ids = INDEX[s_class][k].get(attributes[k], {})
+                except TypeError:
+                    continue
+                objs = DATA[s_class]
+                candidates = [objs[obj_id] for obj_id in list(ids)
+                              if obj_id in objs]
+                break
+        return list(filter(_search, candidates))
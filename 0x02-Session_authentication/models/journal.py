@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+""" Journal module: append-only JSON-lines storage of put/delete records
+"""
+import json
+import os
+import threading
+from typing import Callable, Iterator
+
+
+class Journal():
+    """ Append-only log of changes on top of a JSON snapshot file
+    """
+
+    def __init__(self, journal_path: str, snapshot_path: str):
+        """ Initialize a Journal for one model class
+        """
+        self.journal_path = journal_path
+        self.snapshot_path = snapshot_path
+        self.records = 0
+        self.compacting = False
+        self._lock = threading.Lock()
+        self._file = None
+
+    def append(self, op: str, obj_id: str, obj_json: dict = None,
+               sync: bool = False):
+        """ Append one `put` or `del` record, forcing it to disk if `sync`
+        """
+        record = {"op": op, "id": obj_id}
+        if obj_json is not None:
+            record["obj"] = obj_json
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_path, 'a')
+            self._file.write(line)
+            self._file.flush()
+            if sync:
+                os.fsync(self._file.fileno())
+            self.records += 1
+
+    def replay(self) -> Iterator[dict]:
+        """ Yield every complete record of the journal, in order
+        """
+        self.records = 0
+        if not os.path.exists(self.journal_path):
+            return
+        good = 0
+        with open(self.journal_path, 'rb+') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError
+                    record = json.loads(line)
+                except ValueError:
+                    # torn write from a crash: drop it so later appends
+                    # start on a clean line
+                    f.truncate(good)
+                    break
+                good += len(line)
+                self.records += 1
+                yield record
+
+    def compact(self, snapshot: Callable[[], dict]):
+        """ Rewrite the snapshot from `snapshot()` and empty the journal
+
+        The snapshot goes to a temporary file first and replaces the old
+        one atomically, so a crash leaves either the old snapshot and its
+        journal or the new snapshot (and a journal replaying idempotently)
+        """
+        tmp_path = "{}.tmp".format(self.snapshot_path)
+        with self._lock:
+            try:
+                objs_json = snapshot()
+                with open(tmp_path, 'w') as f:
+                    json.dump(objs_json, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+                if self._file is not None:
+                    self._file.close()
+                self._file = open(self.journal_path, 'w')
+                self.records = 0
+            finally:
+                self.compacting = False
+
+    def compact_in_background(self, snapshot: Callable[[], dict]):
+        """ Start a compaction thread unless one is already running
+        """
+        with self._lock:
+            if self.compacting:
+                return
+            self.compacting = True
+        threading.Thread(target=self.compact, args=(snapshot,),
+                         daemon=True).start()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+""" Snapshot module: memory-mapped binary store of JSON records
+
+Layout of a .db_<Class>.bin file:
+  - header: magic b"MDB1", index offset and index length (uint64 LE)
+  - record payloads: one JSON document per object, back to back
+  - index: JSON {"attributes": [...], "records": [[id, offset, length,
+    [indexed values...]], ...]} with offsets from the start of the file
+
+The file is always rewritten as a whole: every change costs a full
+rewrite unless changes are batched (MODELS_DURABILITY=batched)
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from collections.abc import MutableMapping
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+MAGIC = b"MDB1"
+HEADER = struct.Struct("<4sQQ")
+_MISSING = object()
+
+
+def write_snapshot(file_path: str, attributes: List[str],
+                   records: Iterable[Tuple[str, bytes, list]],
+                   sync: bool = False):
+    """ Write (id, payload, indexed values) records to `file_path`,
+    through a temporary file replaced atomically, forcing it to disk
+    first if `sync`
+    """
+    tmp_path = "{}.tmp".format(file_path)
+    entries = []
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        offset = HEADER.size
+        for obj_id, payload, values in records:
+            f.write(payload)
+            entries.append([obj_id, offset, len(payload), values])
+            offset += len(payload)
+        index = json.dumps({"attributes": list(attributes),
+                            "records": entries}).encode()
+        f.write(index)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, offset, len(index)))
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class Snapshot():
+    """ Read-only, memory-mapped view of a snapshot file
+    """
+
+    def __init__(self, file_path: str):
+        """ Map the file and parse its index
+        """
+        with open(file_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, index_offset, index_length = HEADER.unpack_from(self._mm)
+        if magic != MAGIC:
+            raise ValueError("{} is not a snapshot file".format(file_path))
+        index = json.loads(
+            self._mm[index_offset:index_offset + index_length])
+        self.attributes = index["attributes"]
+        # id -> (offset, length, indexed values)
+        self.entries = {r[0]: (r[1], r[2], r[3]) for r in index["records"]}
+
+    def payload(self, obj_id: str) -> bytes:
+        """ Raw JSON bytes of one record
+        """
+        offset, length, _ = self.entries[obj_id]
+        return self._mm[offset:offset + length]
+
+
+class LazyObjects(MutableMapping):
+    """ id -> object mapping backed by a Snapshot: records are only
+    decoded, with `from_json`, the first time they are accessed
+    """
+
+    def __init__(self, snapshot: Snapshot,
+                 from_json: Callable[[bytes], object]):
+        """ Initialize with every record of the snapshot still encoded
+        """
+        self.snapshot = snapshot
+        self._from_json = from_json
+        self._objs = {}
+        self._pending = dict.fromkeys(snapshot.entries)
+        # request threads may decode the same record at once
+        self._lock = threading.Lock()
+
+    def __getitem__(self, obj_id):
+        """ Object of an id, decoded on first access
+        """
+        obj = self._objs.get(obj_id)
+        if obj is not None:
+            return obj
+        with self._lock:
+            obj = self._objs.get(obj_id)
+            if obj is not None:
+                return obj
+            if obj_id not in self._pending:
+                raise KeyError(obj_id)
+            obj = self._from_json(self.snapshot.payload(obj_id))
+            self._objs[obj_id] = obj
+            del self._pending[obj_id]
+            return obj
+
+    def pop(self, obj_id, default=_MISSING):
+        """ Remove an object and return it, atomically (unlike the
+        MutableMapping get-then-delete)
+        """
+        with self._lock:
+            if obj_id in self._objs:
+                return self._objs.pop(obj_id)
+            if obj_id in self._pending:
+                del self._pending[obj_id]
+                return self._from_json(self.snapshot.payload(obj_id))
+        if default is _MISSING:
+            raise KeyError(obj_id)
+        return default
+
+    def __setitem__(self, obj_id, obj):
+        """ Store a live object
+        """
+        with self._lock:
+            self._pending.pop(obj_id, None)
+            self._objs[obj_id] = obj
+
+    def __delitem__(self, obj_id):
+        """ Forget an object, decoded or not
+        """
+        with self._lock:
+            if obj_id in self._objs:
+                del self._objs[obj_id]
+            elif obj_id in self._pending:
+                del self._pending[obj_id]
+            else:
+                raise KeyError(obj_id)
+
+    def __contains__(self, obj_id) -> bool:
+        """ Membership without decoding
+        """
+        return obj_id in self._objs or obj_id in self._pending
+
+    def __iter__(self) -> Iterator[str]:
+        """ Ids of decoded objects, then of encoded records
+        """
+        decoded, pending = list(self._objs), list(self._pending)
+        yield from decoded
+        yield from pending
+
+    def __len__(self) -> int:
+        """ Number of objects without decoding
+        """
+        return len(self._objs) + len(self._pending)
+
+    def raw(self, obj_id: str) -> Tuple[bytes, list]:
+        """ (payload, indexed values) of a record never decoded, or None
+        """
+        if obj_id not in self._pending:
+            return None
+        _, _, values = self.snapshot.entries[obj_id]
+        return self.snapshot.payload(obj_id), values
+
+    def rebase(self, snapshot: Snapshot):
+        """ Point the encoded records at a freshly written snapshot
+        """
+        self.snapshot = snapshot
@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 """User session module.
 """
-from models.base import Base
+from os import getenv
+from models.base import Base, COMPACT
 
 
 class UserSession(Base):
     """User session class.
     """
 
+    indexed_attributes = ('session_id',)
+    # sessions are written in batches unless configured otherwise
+    durability = getenv("USER_SESSION_DURABILITY", "batched")
+
+    if COMPACT:
+        __slots__ = ('user_id', 'session_id')
+
     def __init__(self, *args: list, **kwargs: dict):
         """Initializes a User session instance.
         """
@@ -11,7 +11,7 @@ from flask import (Flask,
                    abort,
                    redirect)
 
-from auth import Auth
+from auth import Auth, HashQueueFull
 
 
 app = Flask(__name__)
@@ -19,6 +19,21 @@ app = Flask(__name__)
 AUTH = Auth()
 
 
+@app.teardown_appcontext
+def end_request(exception) -> None:
+    """Close the database session of the request"""
+    AUTH.end_request()
+
+
+@app.errorhandler(HashQueueFull)
+def hash_queue_full(error) -> str:
+    """Password hashing is saturated: ask the client to retry"""
+    response = jsonify({"message": "server busy, retry later"})
+    response.status_code = 503
+    response.headers["Retry-After"] = "1"
+    return response
+
+
 @app.route("/", methods=["GET"], strict_slashes=False)
 def index() -> str:
     """GET method
@@ -44,6 +59,8 @@ def register_user():
         else:
             return jsonify({"message": "email already registered"}), 400
 
+    except HashQueueFull:
+        raise
     except Exception as e:
         return jsonify({"message": str(e)}), 500
 
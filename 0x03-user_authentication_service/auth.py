@@ -5,22 +5,157 @@ Hashing input passwords
 
 
 import bcrypt
+import os
+import threading
+import time
 import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm.exc import NoResultFound
-from typing import Union
+from typing import Callable, Dict, Iterable, List, Tuple, Union
 
 from db import DB
 from user import User
 
 
+# bcrypt.gensalt() default, shared with 0x00-personal_data through
+# BCRYPT_COST (see encrypt_password.py --calibrate)
+DEFAULT_BCRYPT_COST = 12
+
+
+@lru_cache(maxsize=None)
+def _target_cost() -> int:
+    """BCRYPT_COST if set, otherwise DEFAULT_BCRYPT_COST
+    """
+    return int(os.getenv("BCRYPT_COST") or DEFAULT_BCRYPT_COST)
+
+
+def _needs_rehash(hashed_password: bytes) -> bool:
+    """Was the hash made with a cost below the current target?
+    """
+    return int(hashed_password.split(b"$")[2]) < _target_cost()
+
+
 def _hash_password(password: str) -> bytes:
     """hash password"""
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=_target_cost())
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
 
     return hashed_password
 
 
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    """bcrypt hash at the given cost (runs in a hashing worker)"""
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password: bytes, hashed_password: bytes) -> bool:
+    """bcrypt verification (runs in a hashing worker)"""
+    return bcrypt.checkpw(password, hashed_password)
+
+
+class HashQueueFull(Exception):
+    """Raised when the hashing executor has no free slot"""
+
+
+class HashExecutor:
+    """Runs bcrypt work on a worker pool with a bounded backlog.
+
+    kind is "thread" or "process"; the defaults come from the
+    HASH_EXECUTOR, HASH_WORKERS and HASH_MAX_PENDING variables.
+    A call that finds max_pending hashes already queued or running
+    raises HashQueueFull instead of waiting.
+    """
+
+    def __init__(self, kind: str = None, workers: int = None,
+                 max_pending: int = None):
+        kind = kind or os.getenv("HASH_EXECUTOR", "thread")
+        workers = workers or int(os.getenv("HASH_WORKERS",
+                                           os.cpu_count() or 1))
+        max_pending = max_pending or int(os.getenv("HASH_MAX_PENDING",
+                                                   4 * workers))
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(workers)
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(workers)
+        else:
+            raise ValueError("unknown hash executor {}".format(kind))
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._hashes = 0
+        self._rejected = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+
+    def _submit(self, fn: Callable, *args, blocking: bool = False) -> Future:
+        """Queue fn in the pool, waiting for a free slot if blocking"""
+        if not self._slots.acquire(blocking=blocking):
+            with self._lock:
+                self._rejected += 1
+            raise HashQueueFull
+        with self._lock:
+            self._pending += 1
+        start = time.perf_counter()
+
+        def done(future: Future) -> None:
+            elapsed = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._pending -= 1
+                self._hashes += 1
+                self._total_ms += elapsed
+                self._max_ms = max(self._max_ms, elapsed)
+            self._slots.release()
+
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            self._slots.release()
+            raise
+        future.add_done_callback(done)
+        return future
+
+    def _run(self, fn: Callable, *args):
+        """Run fn in the pool and wait for its result"""
+        return self._submit(fn, *args).result()
+
+    def hash(self, password: str) -> bytes:
+        """Hash a password at the target cost"""
+        return self._run(_hashpw, password.encode('utf-8'), _target_cost())
+
+    def hash_many(self, passwords: Iterable[str]) -> List[bytes]:
+        """Hash passwords on the whole pool, in order; waits for free
+        slots instead of raising HashQueueFull (meant for imports)
+        """
+        rounds = _target_cost()
+        futures = [self._submit(_hashpw, password.encode('utf-8'), rounds,
+                                blocking=True)
+                   for password in passwords]
+        return [future.result() for future in futures]
+
+    def check(self, password: str, hashed_password: bytes) -> bool:
+        """Check a password against its hash"""
+        return self._run(_checkpw, password.encode('utf-8'), hashed_password)
+
+    @property
+    def metrics(self) -> Dict[str, float]:
+        """Queue depth, rejections and hash latency (ms) so far"""
+        with self._lock:
+            return {
+                "queue_depth": self._pending,
+                "max_pending": self.max_pending,
+                "hashes": self._hashes,
+                "rejected": self._rejected,
+                "avg_ms": self._total_ms / self._hashes if self._hashes
+                else 0.0,
+                "max_ms": self._max_ms,
+            }
+
+
 def _generate_uuid() -> str:
     """
     Generate a new UUID and return it as a string.
@@ -34,19 +169,50 @@ class Auth:
     """Auth class to interact with the authentication database.
     """
 
-    def __init__(self):
+    def __init__(self, hasher: HashExecutor = None):
         self._db = DB()
+        self._hasher = hasher if hasher is not None else HashExecutor()
+
+    def end_request(self) -> None:
+        """Release the database session used by the current request.
+        """
+        self._db.remove_session()
 
     def register_user(self, email: str, password: str) -> User:
         """Register new user to the database.
         """
         try:
-            self._db.find_user_by(email=email)
-        except NoResultFound:
-            return self._db.add_user(email, _hash_password(password))
-        else:
+            return self._db.add_user(email, self._hasher.hash(password))
+        except IntegrityError:
             raise ValueError("User {} already exists".format(email))
 
+    def register_users(self, users: Iterable[Tuple[str, str]],
+                       batch_size: int = 1000) -> int:
+        """Register (email, password) pairs, one transaction per batch
+        of batch_size users. Emails already registered, or repeated,
+        are skipped on SQLite, PostgreSQL and MySQL; other databases
+        raise IntegrityError and roll back the whole failing batch.
+        Return: Number of users registered.
+        """
+        registered = 0
+        batch = []
+        for user in users:
+            batch.append(user)
+            if len(batch) == batch_size:
+                registered += self._register_batch(batch)
+                batch = []
+        if batch:
+            registered += self._register_batch(batch)
+        return registered
+
+    def _register_batch(self, batch: List[Tuple[str, str]]) -> int:
+        """Hash the passwords of a batch and insert it"""
+        hashed_passwords = self._hasher.hash_many(
+            [password for _, password in batch])
+        return self._db.add_users(
+            [(email, hashed_password) for (email, _), hashed_password
+             in zip(batch, hashed_passwords)])
+
     def valid_login(self, email: str, password: str) -> bool:
         """ Locate the user by email
         """
@@ -57,9 +223,18 @@ class Auth:
 
         # Check if the provided password matches the hashed password
         hashed_password = user.hashed_password
-        provided_password = password.encode()
 
-        if bcrypt.checkpw(provided_password, hashed_password):
+        if self._hasher.check(password, hashed_password):
+            # upgrade hashes made with a weaker cost while we know
+            # the plain password; optional, so skipped when hashing is
+            # saturated rather than failing a valid login
+            if _needs_rehash(hashed_password):
+                try:
+                    rehashed = self._hasher.hash(password)
+                except HashQueueFull:
+                    pass
+                else:
+                    self._db.update_user(user.id, hashed_password=rehashed)
             return True
 
         return False
@@ -68,16 +243,12 @@ class Auth:
         """takes an email string argument and returns the
         session ID as a string.
         """
-        try:
-            user = self._db.find_user_by(email=email)
-        except NoResultFound:
-            return None
-
         # Generate a new UUID using your _generate_uuid function
         session_id = _generate_uuid()
 
         # Store the session_id in the database for the user
-        self._db.update_user(user.id, session_id=session_id)
+        if not self._db.update_users({"email": email}, session_id=session_id):
+            return None
 
         return session_id
 
@@ -99,12 +270,7 @@ class Auth:
         """takes a single user_id integer argument and
         returns None.
         """
-        try:
-            user = self._db.find_user_by(id=user_id)
-        except NoResultFound:
-            return None
-
-        self._db.update_user(user.id, session_id=None)
+        self._db.update_users({"id": user_id}, session_id=None)
 
         return None
 
@@ -112,14 +278,11 @@ class Auth:
         """If the user does not exist, raise a ValueError exception.
         If it exists, generate a UUID and update the user’s
           reset_token database field. Return the toke"""
-        try:
-            user = self._db.find_user_by(email=email)
-        except NoResultFound:
-            raise ValueError
-
         reset_pwd_token = _generate_uuid()
 
-        self._db.update_user(user.id, reset_token=reset_pwd_token)
+        if not self._db.update_users({"email": email},
+                                     reset_token=reset_pwd_token):
+            raise ValueError
 
         return reset_pwd_token
 
@@ -132,12 +295,15 @@ class Auth:
         if reset_token is None or password is None:
             return None
 
+        # cheap indexed check first: unknown tokens must not cost a hash
         try:
-            user = self._db.find_user_by(reset_token=reset_token)
+            self._db.find_user_by(reset_token=reset_token)
         except NoResultFound:
             raise ValueError
 
-        hashed_password = _hash_password(password)
-        self._db.update_user(user.id,
-                             hashed_password=hashed_password,
-                             reset_token=None)
+        hashed_password = self._hasher.hash(password)
+        # still conditional on the token, in case it was used meanwhile
+        if not self._db.update_users({"reset_token": reset_token},
+                                     hashed_password=hashed_password,
+                                     reset_token=None):
+            raise ValueError
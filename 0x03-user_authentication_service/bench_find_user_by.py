@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: DB.find_user_by latency on a large users table, without and
+with the indexes of the current schema
+
+Usage: ./bench_find_user_by.py [rows] [lookups]
+"""
+
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from db import DB
+from user import User
+
+
+def fill(db: DB, rows: int) -> list:
+    """Insert rows users in batches and return a few of them to look up
+    """
+    table = User.__table__
+    samples = []
+    with db._engine.begin() as conn:
+        for start in range(0, rows, 10000):
+            batch = []
+            for i in range(start, min(start + 10000, rows)):
+                batch.append({
+                    "email": "user{}@example.com".format(i),
+                    "hashed_password": "x" * 60,
+                    "session_id": str(uuid.uuid4()),
+                    "reset_token": str(uuid.uuid4()),
+                })
+            conn.execute(table.insert(), batch)
+            samples.append(batch[len(batch) // 2])
+    return samples
+
+
+def drop_indexes(db: DB) -> None:
+    """Remove the indexes of the users table"""
+    with db._engine.begin() as conn:
+        for index in User.__table__.indexes:
+            index.drop(conn)
+
+
+def create_indexes(db: DB) -> None:
+    """Add the indexes of the users table back"""
+    with db._engine.begin() as conn:
+        for index in User.__table__.indexes:
+            index.create(conn)
+
+
+def latency(db: DB, column: str, samples: list, lookups: int) -> float:
+    """Average milliseconds of find_user_by(column=...)"""
+    start = time.perf_counter()
+    for i in range(lookups):
+        db.find_user_by(**{column: samples[i % len(samples)][column]})
+    return (time.perf_counter() - start) * 1000 / lookups
+
+
+def main():
+    """Benchmark entry point"""
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    lookups = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DB("sqlite:///" + os.path.join(tmp, "bench.db"), "reset")
+        drop_indexes(db)
+        samples = fill(db, rows)
+        columns = ("email", "session_id", "reset_token")
+        before = {c: latency(db, c, samples, lookups) for c in columns}
+        create_indexes(db)
+        after = {c: latency(db, c, samples, lookups) for c in columns}
+        print("{} rows, {} lookups per column".format(rows, lookups))
+        print("{:<12} {:>13} {:>13} {:>9}".format(
+            "column", "no index (ms)", "indexed (ms)", "speedup"))
+        for c in columns:
+            print("{:<12} {:>13.3f} {:>13.3f} {:>8.0f}x".format(
+                c, before[c], after[c], before[c] / after[c]))
+
+
+if __name__ == "__main__":
+    main()
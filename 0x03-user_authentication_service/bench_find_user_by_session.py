@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: per-call overhead of DB.find_user_by(session_id=...),
+the lookup behind GET /profile, against the previous implementation
+
+Usage: ./bench_find_user_by_session.py [calls]
+"""
+
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm.exc import NoResultFound
+
+from db import DB
+from user import User
+
+
+def legacy_find_user_by(db: DB, **kwargs) -> User:
+    """Previous find_user_by: column list scan and a new ORM query per
+    call
+    """
+    if not kwargs:
+        raise InvalidRequestError
+
+    column_names = User.__table__.columns.keys()
+    for key in kwargs.keys():
+        if key not in column_names:
+            raise InvalidRequestError
+
+    user = db._session.query(User).filter_by(**kwargs).first()
+
+    if user is None:
+        raise NoResultFound
+
+    return user
+
+
+def per_call(find, session_ids: list, calls: int) -> float:
+    """Average microseconds of find(session_id=...)"""
+    start = time.perf_counter()
+    for i in range(calls):
+        find(session_id=session_ids[i % len(session_ids)])
+    return (time.perf_counter() - start) * 1e6 / calls
+
+
+def main():
+    """Benchmark entry point"""
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = DB("sqlite:///" + os.path.join(tmp, "bench.db"), "reset")
+        session_ids = []
+        for i in range(1000):
+            user = db.add_user("user{}@example.com".format(i), "x" * 60)
+            session_ids.append(str(uuid.uuid4()))
+            db.update_user(user.id, session_id=session_ids[-1])
+        # warm up both paths
+        per_call(lambda **kw: legacy_find_user_by(db, **kw), session_ids,
+                 1000)
+        per_call(db.find_user_by, session_ids, 1000)
+        before = per_call(lambda **kw: legacy_find_user_by(db, **kw),
+                          session_ids, calls)
+        after = per_call(db.find_user_by, session_ids, calls)
+        print("{} calls of find_user_by(session_id=...)".format(calls))
+        print("before {:>8.1f} us/call".format(before))
+        print("after  {:>8.1f} us/call".format(after))
+        print("saved  {:>7.0f}%".format(100 * (1 - after / before)))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,33 +3,104 @@
 """
 
 
-from sqlalchemy import create_engine
+import os
+
+from functools import lru_cache
+from sqlalchemy import bindparam, create_engine, event, select, update
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, InvalidRequestError
 from sqlalchemy.orm.exc import NoResultFound
-from typing import TypeVar
+from typing import List, Tuple, TypeVar
 
+from migrations import migrate
 from user import Base, User
 
 
+def _create_engine(url: str) -> Engine:
+    """Engine for url, with a connection pool sized by AUTH_DB_POOL_SIZE,
+    AUTH_DB_MAX_OVERFLOW and AUTH_DB_POOL_TIMEOUT (seconds).
+
+    SQLite connections run in WAL mode with synchronous=NORMAL, so
+    readers no longer wait for the writer, and wait up to
+    AUTH_DB_BUSY_TIMEOUT milliseconds for a lock instead of failing.
+    """
+    url = make_url(url)
+    options = {}
+    sqlite = url.get_backend_name() == "sqlite"
+    if not sqlite or url.database not in (None, "", ":memory:"):
+        # in-memory SQLite lives in a single connection: no pool to size
+        options.update(
+            pool_size=int(os.getenv("AUTH_DB_POOL_SIZE", "5")),
+            max_overflow=int(os.getenv("AUTH_DB_MAX_OVERFLOW", "10")),
+            pool_timeout=float(os.getenv("AUTH_DB_POOL_TIMEOUT", "30")),
+            pool_pre_ping=not sqlite)
+    engine = create_engine(url, echo=False, **options)
+
+    if sqlite:
+        busy_timeout = int(os.getenv("AUTH_DB_BUSY_TIMEOUT", "5000"))
+
+        @event.listens_for(engine, "connect")
+        def tune_sqlite(dbapi_connection, connection_record):
+            """Per-connection SQLite settings"""
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute("PRAGMA busy_timeout={:d}".format(busy_timeout))
+            cursor.close()
+
+    return engine
+
+
+@lru_cache(maxsize=None)
+def _lookup_statement(keys: Tuple[str, ...]):
+    """SELECT of the first user whose columns keys equal the bound
+    parameters of the same names, built once per set of columns so
+    SQLAlchemy reuses its compiled form
+    """
+    columns = User.__table__.columns
+    return select(User).where(
+        *(columns[key] == bindparam(key) for key in keys)).limit(1)
+
+
 class DB:
     """ DB Class"""
 
-    def __init__(self):
-        """Initialize a new DB instance"""
-        self._engine = create_engine("sqlite:///a.db", echo=False)
-        Base.metadata.drop_all(self._engine)
-        Base.metadata.create_all(self._engine)
-        self.__session = None
+    # columns accepted by find_user_by and update_users
+    _columns = frozenset(User.__table__.columns.keys())
+
+    def __init__(self, url: str = None, schema: str = None):
+        """Initialize a new DB instance
+
+        url defaults to AUTH_DB_URL (sqlite:///a.db). schema, or
+        AUTH_DB_SCHEMA, is "reset" (default: drop and recreate the
+        tables) or "migrate" (keep the data and apply pending
+        migrations).
+        """
+        url = url or os.getenv("AUTH_DB_URL", "sqlite:///a.db")
+        schema = schema or os.getenv("AUTH_DB_SCHEMA", "reset")
+        self._engine = _create_engine(url)
+        if schema == "reset":
+            Base.metadata.drop_all(self._engine)
+            Base.metadata.create_all(self._engine)
+        elif schema != "migrate":
+            raise ValueError("unknown schema mode {}".format(schema))
+        migrate(self._engine)
+        # one session per thread, see remove_session
+        self.__session = scoped_session(sessionmaker(bind=self._engine))
 
     @property
     def _session(self):
-        """ Session Getter Method """
-        if self.__session is None:
-            DBSession = sessionmaker(bind=self._engine)
-            self.__session = DBSession()
-        return self.__session
+        """ Session of the current thread """
+        return self.__session()
+
+    def remove_session(self) -> None:
+        """ Close the session of the current thread (at the end of a
+        request), returning its connection to the pool
+        """
+        self.__session.remove()
 
     def add_user(self, email: str, hashed_password: str) -> User:
         """ Adds user to database
@@ -37,10 +108,44 @@ class DB:
         """
         user = User(email=email, hashed_password=hashed_password)
         self._session.add(user)
-        self._session.commit()
+        try:
+            self._session.commit()
+        except IntegrityError:
+            # email already registered (unique index)
+            self._session.rollback()
+            raise
 
         return user
 
+    def add_users(self, users: List[Tuple[str, str]]) -> int:
+        """ Adds (email, hashed_password) users in one transaction,
+        skipping emails already registered (ON CONFLICT DO NOTHING on
+        SQLite and PostgreSQL, INSERT IGNORE on MySQL and MariaDB).
+        Other databases raise IntegrityError and roll the batch back.
+        Return: Number of users added.
+        """
+        if not users:
+            return 0
+        dialect = self._engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            module = {"sqlite": sqlite, "postgresql": postgresql}[dialect]
+            statement = module.insert(User.__table__).on_conflict_do_nothing(
+                index_elements=["email"])
+        elif dialect in ("mysql", "mariadb"):
+            statement = User.__table__.insert().prefix_with("IGNORE")
+        else:
+            statement = User.__table__.insert()
+        rows = [{"email": email, "hashed_password": hashed_password}
+                for email, hashed_password in users]
+        try:
+            result = self._session.execute(statement, rows)
+            self._session.commit()
+        except IntegrityError:
+            self._session.rollback()
+            raise
+
+        return result.rowcount
+
     def find_user_by(self, **kwargs) -> User:
         """ Finds user filtered by the method’s input arguments
         Return: First row found in the users table.
@@ -48,31 +153,45 @@ class DB:
         if not kwargs:
             raise InvalidRequestError
 
-        column_names = User.__table__.columns.keys()
-        for key in kwargs.keys():
-            if key not in column_names:
-                raise InvalidRequestError
+        if not self._columns.issuperset(kwargs):
+            raise InvalidRequestError
 
-        user = self._session.query(User).filter_by(**kwargs).first()
+        if None in kwargs.values():
+            # "= NULL" never matches: let filter_by write "IS NULL"
+            user = self._session.query(User).filter_by(**kwargs).first()
+        else:
+            statement = _lookup_statement(tuple(sorted(kwargs)))
+            user = self._session.execute(statement, kwargs).scalar()
 
         if user is None:
             raise NoResultFound
 
         return user
 
-    def update_user(self, user_id: int, **kwargs) -> None:
-        """ locate the user to update, then will update
-        the user’s attributes as passed in the method’s
-        arguments then commit changes to the database.
+    def update_users(self, where: dict, **kwargs) -> int:
+        """ Set the columns given as keyword arguments on every user
+        matching where, with a single UPDATE statement.
+        Return: Number of users updated.
         """
-        user = self.find_user_by(id=user_id)
-
-        column_names = User.__table__.columns.keys()
-        for key in kwargs.keys():
-            if key not in column_names:
-                raise ValueError
+        if not where:
+            raise InvalidRequestError
 
-        for key, value in kwargs.items():
-            setattr(user, key, value)
+        if not self._columns.issuperset(where):
+            raise InvalidRequestError
+        if not self._columns.issuperset(kwargs):
+            raise ValueError
 
+        statement = update(User).filter_by(**where).values(**kwargs) \
+            .execution_options(synchronize_session="evaluate")
+        result = self._session.execute(statement)
         self._session.commit()
+
+        return result.rowcount
+
+    def update_user(self, user_id: int, **kwargs) -> None:
+        """ update the user’s attributes as passed in the method’s
+        arguments and commit changes to the database.
+        Raise NoResultFound if there is no such user.
+        """
+        if not self.update_users({"id": user_id}, **kwargs):
+            raise NoResultFound
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations of the users database
+"""
+
+
+from sqlalchemy import (Column, Index, Integer, MetaData, String, Table,
+                        inspect, select)
+from sqlalchemy.engine import Connection, Engine
+from typing import Callable, List, Tuple
+
+
+metadata = MetaData()
+
+schema_version = Table(
+    "schema_version", metadata,
+    Column("version", Integer, primary_key=True),
+)
+
+
+# Each migration declares the schema objects it needs as they were when
+# it was released, so later changes to user.py cannot alter it.
+
+def _users_v1(metadata: MetaData) -> Table:
+    """users table as first released, without indexes"""
+    return Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("email", String(250), nullable=False),
+        Column("hashed_password", String(250), nullable=False),
+        Column("session_id", String(250), nullable=True),
+        Column("reset_token", String(250), nullable=True),
+    )
+
+
+def _create_users(conn: Connection) -> None:
+    """Create the users table if it is missing"""
+    _users_v1(MetaData()).create(conn, checkfirst=True)
+
+
+def _index_users(conn: Connection) -> None:
+    """Index the lookup columns of the users table"""
+    users = _users_v1(MetaData())
+    for index in (Index("ix_users_email", users.c.email),
+                  Index("ix_users_session_id", users.c.session_id,
+                        unique=True),
+                  Index("ix_users_reset_token", users.c.reset_token,
+                        unique=True)):
+        index.create(conn, checkfirst=True)
+
+
+def _unique_email(conn: Connection) -> None:
+    """Turn the plain index on users.email into a unique one; fails
+    with IntegrityError while duplicate emails remain
+    """
+    users = _users_v1(MetaData())
+    for index in inspect(conn).get_indexes("users"):
+        if index["column_names"] == ["email"]:
+            if index["unique"]:
+                return
+            Index(index["name"], users.c.email).drop(conn)
+    Index("ix_users_email", users.c.email, unique=True).create(conn)
+
+
+# (version, description, upgrade) in order; never edit a released entry,
+# append a new one instead
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "create users", _create_users),
+    (2, "index users.email, session_id and reset_token", _index_users),
+    (3, "unique users.email", _unique_email),
+]
+
+
+def current_version(engine: Engine) -> int:
+    """Version of the schema, 0 for an empty database"""
+    with engine.begin() as conn:
+        metadata.create_all(conn)
+        version = conn.execute(
+            select(schema_version.c.version)).scalar()
+    return version or 0
+
+
+def migrate(engine: Engine) -> int:
+    """Apply the pending migrations, each in its own transaction,
+    and return the resulting version
+    """
+    version = current_version(engine)
+    for target, _, upgrade in MIGRATIONS:
+        if target <= version:
+            continue
+        with engine.begin() as conn:
+            upgrade(conn)
+            conn.execute(schema_version.delete())
+            conn.execute(schema_version.insert().values(version=target))
+        version = target
+    return version